@@ -13,7 +13,8 @@ DUMP_DIR=${ANALYSIS_DIR}/dump/
 
 FINAL_UPDATE=100000
 
-python3 aggregate.py \
+python3 ${REPO_SCRIPTS_DIR}/aggregate.py \
+  --spec ${ANALYSIS_DIR}/aggregate-spec.json \
   --data_dir ${DATA_DIR} \
   --dump_dir ${DUMP_DIR} \
   --summary_update ${FINAL_UPDATE} \
@@ -1,4 +1,16 @@
+'''
+Aggregate birth counts by location (loc_birth_counts.csv) from a directory of avida runs.
+
+This script generates the following output files:
+- graph_birth_info.csv: one line per run per location.
+- graph_birth_info.npz (with --births_matrix): (runs x locations) birth count matrix along
+  with each run's seed / graph (see utilities.write_births_matrix). Can be given to
+  annotate-graph-loc-info.py and summarize-node-properties.py in place of graph_birth_info.csv.
+'''
+
 import argparse
+import functools
+import multiprocessing
 import os
 import sys
 import pathlib
@@ -20,102 +32,115 @@ run_cfg_fields_to_output = {
     "seed"
 }
 
-def append_csv(output_path, out_lines, field_order):
-    lines = []
-    for info in out_lines:
-        line = ",".join([str(info[field]) for field in field_order])
-        lines.append(line)
-    out_content = "\n" + "\n".join(lines)
-    with open(output_path, "a") as fp:
-        fp.write(out_content)
+def read_run_birth_counts(run_path):
+    '''
+    Read run parameters and birth counts by location for a single run.
+    Runs in a worker process when aggregating with multiple jobs.
+    Returns None if the run did not finish. Otherwise, returns a tuple:
+    (run parameters to output, loc ids, births)
+    '''
+    run_cfg_path = os.path.join(run_path, "data", "run_params.csv")
+    loc_birth_counts_path = os.path.join(run_path, "data", "loc_birth_counts.csv")
+    if not (utils.path_isfile(run_cfg_path) and utils.path_isfile(loc_birth_counts_path)):
+        return None
+    output_param_info = {}
+    for line in utils.read_csv(run_cfg_path):
+        if line["param"] in run_cfg_fields_to_output:
+            output_param_info[line["param"]] = line["value"]
+    loc_ids, births = utils.read_loc_birth_counts(loc_birth_counts_path)
+    return (output_param_info, loc_ids, births)
 
 def main():
     parser = argparse.ArgumentParser(description = "Run submission script.")
     parser.add_argument("--data_dir", type=str, help="Where is the base output directory for each run?")
     parser.add_argument("--dump_dir", type=str, help="Where to dump this?", default=".")
+    parser.add_argument("--search_depth", type=int, default=2, help="How many levels of nested directories (e.g., job-set-N) below data_dir to search for runs")
+    parser.add_argument("--discovery_threads", type=int, default=8, help="Number of threads used to scan directories when discovering runs")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes to read runs with")
+    parser.add_argument("--births_matrix", action="store_true", help="Also output (runs x locations) birth count matrix (graph_birth_info.npz)")
 
     args = parser.parse_args()
     data_dir = args.data_dir
     dump_dir = args.dump_dir
+    num_jobs = args.jobs
 
     if not os.path.exists(data_dir):
         print("Unable to find data directory.")
         exit(-1)
 
+    if num_jobs < 1:
+        print("Number of jobs must be >= 1")
+        exit(-1)
+
     utils.mkdir_p(dump_dir)
 
-    # Aggregate run directories.
-    run_dirs = [run_dir for run_dir in os.listdir(data_dir) if run_identifier in run_dir]
-    print(f"Found {len(run_dirs)} run directories.")
+    # Aggregate run directories (loose, nested, or inside .tar/.tar.gz/.zip archives).
+    run_dirs, unfinished_run_dirs = utils.find_run_dirs(
+        data_dir,
+        run_identifier,
+        require_file = os.path.join("data", "run_params.csv"),
+        max_depth = args.search_depth,
+        threads = args.discovery_threads,
+        cache_path = os.path.join(dump_dir, "run_dirs_cache.json")
+    )
+    print(f"Found {len(run_dirs)} run directories ({len(unfinished_run_dirs)} unfinished).")
+
+    run_paths = [os.path.join(data_dir, run_dir) for run_dir in run_dirs]
+    pool = None
+    if num_jobs > 1:
+        pool = multiprocessing.Pool(num_jobs)
+        run_results = pool.imap(read_run_birth_counts, run_paths, chunksize=4)
+    else:
+        run_results = (read_run_birth_counts(run_path) for run_path in run_paths)
 
     graph_info_header = None
     graph_info_fpath = os.path.join(dump_dir, "graph_birth_info.csv")
-    with open(graph_info_fpath, "w") as fp:
-        fp.write("")
-
-    for run_dir_i in range(len(run_dirs)):
-        run_dir = run_dirs[run_dir_i]
-        print(f"...({run_dir_i + 1}/{len(run_dirs)}) aggregating from {run_dir}")
-        run_path = os.path.join(data_dir, run_dir)
-
-        run_graph_info_lines = [] # Holds lines for this run's graph info
-
-        ########################################
-        # Extract run parameters
-        ########################################
-        run_cfg_path = os.path.join(run_path, "data", "run_params.csv")
-        if not os.path.isfile(run_cfg_path):
-            print("Run did not finish, skipping")
-            continue
-
-        run_cfg_data = utils.read_csv(run_cfg_path)
-        run_params = {}
-        output_param_info = {}
-        for line in run_cfg_data:
-            param = line["param"]
-            value = line["value"]
-            run_params[param] = value
-            if param in run_cfg_fields_to_output:
-                output_param_info[param] = value
-        max_pop_size = int(run_params["WORLD_X"]) * int(run_params["WORLD_Y"])
-
-        ########################################
-        # Extract birth counts
-        ########################################
-        loc_birth_counts_path = os.path.join(run_path, "data", "loc_birth_counts.csv")
-        loc_birth_counts_data = utils.read_csv(loc_birth_counts_path)
-        for line in loc_birth_counts_data:
-            birth_count = line["births"]
-            loc_id = line["loc_id"]
-            run_graph_info_lines.append({"births":birth_count, "loc_id":loc_id})
-            run_graph_info_lines[-1].update(output_param_info)
-
-        ########################################
-        # Write out to file
-        ########################################
-        fields = list(run_graph_info_lines[-1].keys())
-        fields.sort()
-        header = ",".join(fields)
-        write_header = False
-        if graph_info_header is None:
-            write_header = True
-            graph_info_header = header
-        elif graph_info_header != header:
-            print("Header mismatch!")
-            exit(-1)
-        # Write info line-by-line
-        output_lines = []
-        for row_i in range(len(run_graph_info_lines)):
-            row = run_graph_info_lines[row_i]
-            output_lines.append(
-                ",".join(str(row[field]) for field in fields)
-            )
-        with open(graph_info_fpath, "a") as fp:
-            if write_header:
+    matrix_run_info = []    # Per-run info for births matrix
+    matrix_run_births = []  # Per-run (loc ids, births) for births matrix
+
+    # Write all runs through a single (buffered) file handle. Results arrive in run directory order.
+    with open(graph_info_fpath, "w", buffering=1024*1024) as fp:
+        for run_dir_i, run_result in enumerate(run_results):
+            run_dir = run_dirs[run_dir_i]
+            print(f"...({run_dir_i + 1}/{len(run_dirs)}) aggregated from {run_dir}")
+            if run_result is None:
+                print("Run did not finish, skipping")
+                continue
+            output_param_info, loc_ids, births = run_result
+
+            ########################################
+            # Write out to file
+            ########################################
+            fields = sorted(["births", "loc_id"] + list(output_param_info.keys()))
+            header = ",".join(fields)
+            if graph_info_header is None:
+                graph_info_header = header
                 fp.write(graph_info_header)
-            fp.write("\n")
-            fp.write("\n".join(output_lines))
-        output_lines = []
+            elif graph_info_header != header:
+                print("Header mismatch!")
+                exit(-1)
+            # Write info line-by-line
+            row = dict(output_param_info)
+            for loc_id, loc_births in zip(loc_ids.tolist(), births.tolist()):
+                row["births"] = loc_births
+                row["loc_id"] = loc_id
+                fp.write("\n")
+                fp.write(",".join(str(row[field]) for field in fields))
+
+            if args.births_matrix:
+                matrix_run_info.append(output_param_info)
+                matrix_run_births.append((loc_ids, births))
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    if args.births_matrix:
+        utils.write_births_matrix(
+            os.path.join(dump_dir, "graph_birth_info.npz"),
+            matrix_run_info,
+            matrix_run_births
+        )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,1054 @@
+'''
+Aggregate data from a directory of avida runs.
+
+Which data files and fields to pull from each run are given by a per-experiment
+json specification file (see experiments/<experiment>/analysis/aggregate-spec.json).
+Any field not given in the specification falls back to default_spec.
+
+Run directories may also be read directly out of .tar, .tar.gz, or .zip archives in
+data_dir, either one archive per run or many run directories per archive.
+
+This script generates the following output files:
+- summary.csv: one line per-replicate (per summary update). dom_detail_* and
+  dom_task_total fields describe the final dominant genotype (detail_dominant.dat is only
+  written at the end of a run), so they do not vary by summary update.
+- time_series.csv: time series data for each replicate that reached the final summary update.
+- task_grids/task_loc_info_<seed>.csv: task profile at each location (if task_grids enabled).
+  With --task_grid_format packed, all task grids are instead written to a single binary file
+  (task_grids/task_profiles.bin + task_grids/task_profiles_index.csv; see utilities.py).
+  Use export-task-grids.py to recreate the per-seed csv files from packed task grids.
+- aggregate_manifest.json: records which runs have been aggregated (used by --incremental).
+- run_dirs_cache.json: cached run discovery (reused while searched directories are unchanged).
+- aggregate_progress.jsonl: progress log (one json object per line) with throughput,
+  per-file parse time, and estimated time remaining. Appended to with --incremental.
+
+With --checkpoint_interval, output files and the manifest are checkpointed as runs are
+aggregated. An interrupted aggregation can be resumed by re-running with --incremental.
+
+With --low_memory, summary rows are written out as each run is aggregated, and data
+files are streamed so that only the columns (and updates) needed are held in memory.
+'''
+
+import argparse
+import collections
+import copy
+import functools
+import json
+import multiprocessing
+import numpy as np
+import os
+import shutil
+import time
+from scipy.stats import entropy
+import utilities as utils
+
+manifest_fname = "aggregate_manifest.json"
+progress_log_fname = "aggregate_progress.jsonl"
+run_dirs_cache_fname = "run_dirs_cache.json"
+
+# Default aggregation specification.
+default_spec = {
+    # Run directories must contain this identifier.
+    "run_identifier": "RUN_",
+    # Run configuration fields to keep as fields in summary output file.
+    "run_cfg_fields_summary": [
+        "WORLD_X",
+        "WORLD_Y",
+        "COPY_MUT_PROB",
+        "DIVIDE_INS_PROB",
+        "DIVIDE_DEL_PROB",
+        "BIRTH_METHOD",
+        "graph_file",
+        "graph_type",
+        "events_file_name",
+        "EVENT_FILE",
+        "ENVIRONMENT_FILE",
+        "seed"
+    ],
+    # Run configuration fields to keep as fields in time series output file.
+    "run_cfg_fields_time_series": [
+        "graph_type",
+        "seed",
+        "ENVIRONMENT_FILE"
+    ],
+    # Name of data file (in data_files) used to determine which updates a run has data for.
+    "updates_file": "time",
+    # Data files with one row per update. For each, which fields to pull for summary
+    # and time series output. Output fields are prefixed with the given prefix.
+    # - format must be one of "csv" or "avida_dat"
+    "data_files": [
+        {
+            "name": "time",
+            "file": "time.dat",
+            "format": "avida_dat",
+            "prefix": "time",
+            "summary_fields": ["average_generation"],
+            "time_series_fields": ["average_generation"]
+        },
+        {
+            "name": "phylodiversity",
+            "file": "phylodiversity.csv",
+            "format": "csv",
+            "prefix": "phylodiv",
+            "summary_fields": [],
+            "time_series_fields": []
+        },
+        {
+            "name": "dominant",
+            "file": "dominant.csv",
+            "format": "csv",
+            "prefix": "dominant",
+            "summary_fields": [],
+            "time_series_fields": []
+        }
+    ],
+    # Fields to pull from first_task_locs.csv (for every task)
+    "first_task_locs_fields": ["completed", "loc_id", "loc_x", "loc_y", "update"],
+    # Fields (computed from tasks.dat) to include in time series output
+    "tasks_time_series_fields": ["total_tasks_done", "equals_done"],
+    # Fields to pull from detail_dominant.dat
+    # - Always taken from the final line (the same for every summary update)
+    "dom_detail_fields": ["gestation_time", "genome_length"],
+    # Pull task fields from detail_dominant.dat (+ dom_task_total)?
+    "dom_detail_tasks": True,
+    # Read task grids (grid_task.<update>.dat) for each summary update?
+    "task_grids": True
+}
+
+# Readers for each data file format: (read full file, read only final rows of file)
+data_file_readers = {
+    "csv": (utils.read_csv, utils.read_csv_tail),
+    "avida_dat": (utils.read_avida_dat_file, utils.read_avida_dat_file_tail)
+}
+# Streaming (row-by-row) readers for each data file format (used by --low_memory)
+data_file_iterators = {
+    "csv": utils.iter_csv,
+    "avida_dat": utils.iter_avida_dat_file
+}
+
+def load_spec(spec_path):
+    '''
+    Load aggregation specification, filling in any unspecified fields with defaults.
+    '''
+    spec = copy.deepcopy(default_spec)
+    if spec_path is None:
+        return spec
+    with open(spec_path, "r") as fp:
+        user_spec = json.load(fp)
+    unknown_fields = [field for field in user_spec if field not in default_spec]
+    if len(unknown_fields) > 0:
+        print(f"Unknown fields in aggregation spec: {unknown_fields}")
+        exit(-1)
+    spec.update(user_spec)
+    # Validate data files
+    data_file_names = [data_file["name"] for data_file in spec["data_files"]]
+    if spec["updates_file"] not in data_file_names:
+        print(f"Updates file ({spec['updates_file']}) not found in data_files.")
+        exit(-1)
+    for data_file in spec["data_files"]:
+        if data_file["format"] not in data_file_readers:
+            print(f"Unknown data file format: {data_file['format']}")
+            exit(-1)
+        data_file.setdefault("prefix", None)
+        data_file.setdefault("summary_fields", [])
+        data_file.setdefault("time_series_fields", [])
+    return spec
+
+def nearest(target:int, updates:list):
+    return min(updates, key = lambda x:abs(target - x))
+
+def extract_summary_data(data, target_update, fields, prefix=None):
+        info = {}
+
+        # Grab the data line that matches the target update for this run
+        summary_data = [
+            line
+            for line in data
+            if (target_update is None) or (int(line["update"]) == target_update)
+        ][-1]
+
+        # Add specified fields to run summary data
+        for field in summary_data:
+            if field in fields:
+                if prefix is None:
+                    info[field] = summary_data[field]
+                else:
+                    info[f"{prefix}_{field}"] = summary_data[field]
+
+        return info
+
+def read_final_rows(path, target_update, read_full, read_tail, num_rows=1):
+    '''
+    Read only the final rows of a data file (via read_tail) if they are guaranteed
+    to contain the update nearest to target_update. Otherwise, fall back to
+    reading the entire file (via read_full).
+    '''
+    rows = read_tail(path, num_rows)
+    if len(rows) == 0 or target_update is None or int(rows[0]["update"]) <= target_update:
+        return rows
+    return read_full(path)
+
+def add_time_series_info(
+    time_series_data,
+    run_data,
+    fields,
+    prefix = None
+):
+    # For each relevant line in run data, add relevant fields to time_series_data
+    for line in run_data:
+        # Skip over updates we don't want to sample
+        line_update = int(line["update"])
+        if not line_update in time_series_data:
+            continue
+        for field in line:
+            if field in fields:
+                if prefix is None:
+                    time_series_data[line_update][field] = line[field]
+                else:
+                    time_series_data[line_update][f"{prefix}_{field}"] = line[field]
+
+def run_input_signature(run_path):
+    '''
+    Returns the size and modification time of each of a run's input (data) files.
+    Used to detect runs that are new / changed since they were last aggregated.
+    '''
+    run_data_path = os.path.join(run_path, "data")
+    if not utils.path_isdir(run_data_path):
+        return {}
+    return {
+        name:[size, mtime_ns]
+        for name, is_file, size, mtime_ns in utils.scan_dir(run_data_path)
+        if is_file
+    }
+
+def read_manifest_runs(manifest_path, settings):
+    '''
+    Read processed-runs manifest. Returns {} if there is no manifest or if it was
+    generated using different aggregation settings.
+    '''
+    if not os.path.isfile(manifest_path):
+        return {}
+    with open(manifest_path, "r") as fp:
+        manifest = json.load(fp)
+    if manifest["settings"] != settings:
+        print("Aggregation settings changed since last aggregation, reprocessing all runs.")
+        return {}
+    return manifest["runs"]
+
+def write_manifest(manifest_path, settings, runs):
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as fp:
+        json.dump({"settings": settings, "runs": runs}, fp, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def read_data_file(path, data_file_format, summary_only, target_update, fields=None, updates=None):
+    '''
+    Read a data file. In summary-only mode, read only the final rows of the file
+    when possible.
+    If fields and/or updates are given (low-memory mode), stream the file, keeping
+    only the given fields (+ update) for rows at the given updates.
+    '''
+    read_full, read_tail = data_file_readers[data_file_format]
+    if summary_only:
+        rows = read_final_rows(path, target_update, read_full, read_tail)
+    elif fields is None and updates is None:
+        return read_full(path)
+    else:
+        rows = data_file_iterators[data_file_format](
+            path,
+            fields = None if fields is None else set(fields) | {"update"}
+        )
+    if updates is not None:
+        rows = (row for row in rows if int(row["update"]) in updates)
+    if fields is not None:
+        keep_fields = set(fields) | {"update"}
+        rows = ({field:row[field] for field in row if field in keep_fields} for row in rows)
+    return list(rows)
+
+def record_file_read(file_stats, file_type, path, start_time):
+    '''
+    Record time spent reading / parsing a file (since start_time) and its size.
+    file_stats is indexed by file type.
+    '''
+    if file_type not in file_stats:
+        file_stats[file_type] = {"seconds": 0.0, "bytes": 0, "files": 0}
+    file_stats[file_type]["seconds"] += time.perf_counter() - start_time
+    file_stats[file_type]["bytes"] += utils.path_getsize(path)
+    file_stats[file_type]["files"] += 1
+
+def add_file_stats(total_stats, file_stats):
+    for file_type in file_stats:
+        if file_type not in total_stats:
+            total_stats[file_type] = {"seconds": 0.0, "bytes": 0, "files": 0}
+        for field in file_stats[file_type]:
+            total_stats[file_type][field] += file_stats[file_type][field]
+
+def write_progress_log_entry(fp, entry):
+    fp.write(json.dumps(entry) + "\n")
+    fp.flush()
+
+def write_summary_line(fp, header, line):
+    '''
+    Write a single summary line (in the same format as utils.write_csv).
+    Writes the header if one has not yet been written (header is None).
+    Returns the header.
+    '''
+    fields = sorted(line.keys())
+    if header is None:
+        header = fields
+        fp.write(",".join(header))
+    elif header != fields:
+        print("Summary header mismatch!")
+        exit(-1)
+    fp.write("\n")
+    fp.write(",".join([str(line[field]) for field in header]))
+    return header
+
+def aggregate_run(run_path, settings):
+    '''
+    Aggregate summary and time series data from a single run directory.
+    Runs in a worker process when aggregating with multiple jobs.
+    Returns None if the run did not finish. Otherwise, returns a tuple:
+    (summary lines, time series fields (None if no time series), time series lines, file stats, packed task grids)
+    File stats give the time spent reading and size of each type of file read.
+    Packed task grids are only returned if task_grid_format is "packed".
+    '''
+    spec = settings["spec"]
+    dump_dir = settings["dump_dir"]
+    target_updates = settings["target_updates"]
+    final_target_update = target_updates[-1]
+    time_series_units = settings["time_series_units"]
+    time_series_resolution = settings["time_series_resolution"]
+    summary_only = settings["summary_only"]
+    low_memory = settings["low_memory"]
+    task_grid_format = settings["task_grid_format"]
+
+    if low_memory:
+        utils.reset_peak_rss()
+
+    file_stats = {}       # Time spent reading / size of each file type. Indexed by file type.
+    run_summary_info = {} # Hold summary information shared across all target updates for this run.
+    time_series_info = {} # Hold time series information. Indexed by update.
+
+    ########################################
+    # Extract run parameters
+    ########################################
+    run_cfg_path = os.path.join(run_path, "data", "run_params.csv")
+    if not utils.path_isfile(run_cfg_path):
+        print("Run did not finish, skipping")
+        return None
+    start_time = time.perf_counter()
+    run_cfg_data = utils.read_csv(run_cfg_path)
+    record_file_read(file_stats, "run_params.csv", run_cfg_path, start_time)
+    run_cfg_fields_summary = set(spec["run_cfg_fields_summary"])
+    run_params = {}
+    for line in run_cfg_data:
+        param = line["param"]
+        value = line["value"]
+        run_params[param] = value
+        # Add a subset of parameters to summary information for this run.
+        if param in run_cfg_fields_summary:
+            run_summary_info[param] = value
+
+    max_pop_size = int(run_params["WORLD_X"]) * int(run_params["WORLD_Y"])
+
+    ########################################
+    # Extract data from file that determines run updates
+    ########################################
+    data_files = {data_file["name"]:data_file for data_file in spec["data_files"]}
+    updates_file = data_files[spec["updates_file"]]
+    updates_path = os.path.join(run_path, "data", updates_file["file"])
+    start_time = time.perf_counter()
+    updates_data = read_data_file(
+        updates_path,
+        updates_file["format"],
+        summary_only,
+        target_updates[0],
+        fields = (updates_file["summary_fields"] + updates_file["time_series_fields"]) if low_memory else None
+    )
+    record_file_read(file_stats, updates_file["file"], updates_path, start_time)
+
+    # Search for update nearest
+    updates = [int(row["update"]) for row in updates_data]
+    if len(updates) == 0:
+        return ([], None, [], file_stats, [])
+
+    # did run finish with respect to each target update?
+    run_finished_targets = {target:(target in updates) for target in target_updates}
+    # Only collect time series data if run reached final target
+    collect_time_series = run_finished_targets[final_target_update] and not summary_only
+
+    # Extract time series updates (only if run reached target)
+    time_series_updates = utils.filter_time_points(
+        updates,
+        method = time_series_units,
+        resolution = time_series_resolution
+    ) if collect_time_series else []
+    time_series_updates = set(time_series_updates)
+    # Add run cfg information to time_series info
+    time_series_info = {
+        update:{field:run_params[field] for field in spec["run_cfg_fields_time_series"]}
+        for update in time_series_updates
+    }
+    for update in time_series_updates:
+        time_series_info[update]["update"] = update
+
+    # Summary information specific to each target update. Indexed by target update.
+    run_target_updates = {target:nearest(target, updates) for target in target_updates}
+    target_summary_info = {
+        target:{
+            "target_update": target,
+            "update": run_target_updates[target],
+            "reached_target_update": run_finished_targets[target]
+        }
+        for target in target_updates
+    }
+
+    # Earliest update we need summary data for from remaining files.
+    min_run_target_update = min(run_target_updates.values())
+    # In low-memory mode, only keep rows for updates we need summary / time series data for.
+    keep_updates = (set(run_target_updates.values()) | time_series_updates) if low_memory else None
+
+    ########################################
+    # Extract data from each data file
+    # - Start with the file used to determine run updates (already loaded).
+    ########################################
+    data_file_order = [updates_file] + [
+        data_file
+        for data_file in spec["data_files"]
+        if data_file["name"] != updates_file["name"]
+    ]
+    for data_file in data_file_order:
+        if data_file["name"] != updates_file["name"]:
+            data_path = os.path.join(run_path, "data", data_file["file"])
+            start_time = time.perf_counter()
+            data = read_data_file(
+                data_path,
+                data_file["format"],
+                summary_only,
+                min_run_target_update,
+                fields = (data_file["summary_fields"] + data_file["time_series_fields"]) if low_memory else None,
+                updates = keep_updates
+            )
+            record_file_read(file_stats, data_file["file"], data_path, start_time)
+        else:
+            data = updates_data
+            updates_data = None
+
+        if len(data) == 0:
+            continue
+
+        # Extract summary info
+        for target in target_updates:
+            target_summary_info[target].update(
+                extract_summary_data(
+                    data = data,
+                    target_update = run_target_updates[target],
+                    fields = set(data_file["summary_fields"]),
+                    prefix = data_file["prefix"]
+                )
+            )
+
+        # Extract time series info
+        if collect_time_series:
+            add_time_series_info(
+                time_series_data = time_series_info,
+                run_data = data,
+                fields = set(data_file["time_series_fields"]),
+                prefix = data_file["prefix"]
+            )
+
+        # Done with this file's data
+        del data
+
+    ########################################
+    # Extract data from first_task_locs.csv
+    ########################################
+    first_task_locs_path = os.path.join(run_path, "data", "first_task_locs.csv")
+    start_time = time.perf_counter()
+    first_task_locs_data = utils.read_csv(first_task_locs_path)
+    record_file_read(file_stats, "first_task_locs.csv", first_task_locs_path, start_time)
+
+    # first_task_locs.csv is written at the end of the run; tasks first completed after a
+    # target update are reported as not completed (as in the file) in that target's summary.
+    for target in target_updates:
+        first_task_loc_info = {}
+        for line in first_task_locs_data:
+            task_name = line["task_name"]
+            completed_by_target = line["completed"] == "1" and int(line["update"]) <= run_target_updates[target]
+            first_task_loc_info.update({
+                f"task_loc_{task_name}_{field}": line[field] if completed_by_target else ("0" if field == "completed" else "-1")
+                for field in spec["first_task_locs_fields"]
+            })
+        target_summary_info[target].update(first_task_loc_info)
+
+    del first_task_locs_data
+
+    ########################################
+    # Extract data from tasks.dat
+    ########################################
+    tasks_path = os.path.join(run_path, "data", "tasks.dat")
+    start_time = time.perf_counter()
+    tasks_data = read_data_file(
+        tasks_path,
+        "avida_dat",
+        summary_only,
+        min_run_target_update,
+        updates = keep_updates
+    )
+    record_file_read(file_stats, "tasks.dat", tasks_path, start_time)
+    pop_thresh = 0.01 * max_pop_size
+
+    tasks = {field for field in tasks_data[-1] if field != "update"}
+    for target in target_updates:
+        tasks_summary_data = extract_summary_data(
+            data = tasks_data,
+            target_update = run_target_updates[target],
+            fields = tasks
+        )
+        # Calculate task completion separately for summary
+        pop_tasks_completed = {
+            f"pop_task_{task}":int(float(tasks_summary_data[task]) >= pop_thresh)
+            for task in tasks_summary_data
+        }
+        pop_tasks_total = sum(pop_tasks_completed[task] for task in pop_tasks_completed)
+        target_summary_info[target].update(
+            pop_tasks_completed
+        )
+        target_summary_info[target]["pop_task_total"] = pop_tasks_total
+
+    print("Tasks:",tasks)
+
+    # Extract time series info
+    if collect_time_series:
+        for line in tasks_data:
+            total_tasks_done = 0
+            for task in tasks:
+                task_cnt = int(line[task])
+                task_exec = task_cnt >= pop_thresh
+                line[f"{task}_done"] = int(task_exec)
+                total_tasks_done += int(task_exec)
+            line["total_tasks_done"] = total_tasks_done
+
+        add_time_series_info(
+            time_series_data = time_series_info,
+            run_data = tasks_data,
+            fields = set(spec["tasks_time_series_fields"]),
+            prefix = "pop_task"
+        )
+
+    del tasks_data
+
+    ########################################
+    # Extract data from detail-dominant.dat
+    # - Final dominant genotype only: dom_detail_* and dom_task_total fields are the
+    #   same in every target update's summary line.
+    ########################################
+    dom_detail_path = os.path.join(run_path, "data", "detail_dominant.dat")
+    dom_detail_fields = set(spec["dom_detail_fields"])
+    if spec["dom_detail_tasks"]:
+        dom_detail_fields.update(tasks)
+    dom_tasks_total = 0
+    if utils.path_isfile(dom_detail_path):
+        start_time = time.perf_counter()
+        if summary_only:
+            dom_detail_data = utils.read_avida_dat_file_tail(dom_detail_path)
+        elif low_memory:
+            # Only need the final line
+            dom_detail_data = list(collections.deque(utils.iter_avida_dat_file(dom_detail_path), maxlen=1))
+        else:
+            dom_detail_data = utils.read_avida_dat_file(dom_detail_path)
+        record_file_read(file_stats, "detail_dominant.dat", dom_detail_path, start_time)
+
+        run_summary_info.update(
+            extract_summary_data(
+                data = dom_detail_data,
+                target_update = None,
+                fields = dom_detail_fields,
+                prefix = "dom_detail"
+            )
+        )
+
+        if spec["dom_detail_tasks"]:
+            dom_tasks_total = sum([int(run_summary_info[f"dom_detail_{task}"]) for task in tasks])
+
+        del dom_detail_data
+    else:
+        if spec["dom_detail_tasks"]:
+            run_summary_info.update(
+                {
+                    f"dom_detail_{task}":"0" for task in tasks
+                }
+            )
+        run_summary_info.update(
+            {f"dom_detail_{field}":"-1" for field in spec["dom_detail_fields"]}
+        )
+
+    if spec["dom_detail_tasks"]:
+        run_summary_info["dom_task_total"] = dom_tasks_total
+
+    ########################################
+    # Extract data from task grid(s)
+    ########################################
+    packed_task_grids = []
+    for target in (target_updates if spec["task_grids"] else []):
+        grid_task_path = os.path.join(run_path, "data", f"grid_task.{target}.dat")
+        if run_finished_targets[target] and utils.path_isfile(grid_task_path):
+            start_time = time.perf_counter()
+            task_grid_data = utils.read_avida_task_grid(grid_task_path, num_tasks = len(tasks))
+            record_file_read(file_stats, "grid_task.<update>.dat", grid_task_path, start_time)
+            # Dump mapping from task grid to task profile
+            # - Only tag file name with update if multiple summary updates requested.
+            task_grid_fname = f"task_loc_info_{run_summary_info['seed']}.csv"
+            if len(target_updates) > 1:
+                task_grid_fname = f"task_loc_info_{run_summary_info['seed']}_{target}.csv"
+            if task_grid_format == "packed":
+                # Packed task grids are written out by the main process.
+                packed_task_grids.append({
+                    "seed": run_summary_info["seed"],
+                    "update": target,
+                    "csv_name": task_grid_fname,
+                    "num_tasks": len(tasks),
+                    "packed": utils.pack_task_grid(task_grid_data)
+                })
+            else:
+                utils.mkdir_p(os.path.join(dump_dir, "task_grids"))
+                utils.write_task_grid_data(
+                    os.path.join(
+                        dump_dir,
+                        "task_grids",
+                        task_grid_fname
+                    ),
+                    task_grid_data
+                )
+            # Add shannon entropy of tasks to summary info
+            task_profiles = {}
+            for id in task_grid_data:
+                info = task_grid_data[id]
+                prof = info["task_profile"]
+                if prof not in task_profiles:
+                    task_profiles[prof] = 0
+                task_profiles[prof] += 1
+            prob_dist = [task_profiles[prof] / len(task_grid_data) for prof in task_profiles]
+            target_summary_info[target]["task_profile_entropy"] = entropy(prob_dist, base=2)
+            target_summary_info[target]["task_profile_count"] = len(task_profiles)
+        else:
+            target_summary_info[target]["task_profile_entropy"] = -1
+            target_summary_info[target]["task_profile_count"] = -1
+
+    ########################################
+    # Add summary info to summary content lines (one line per target update)
+    summary_content_lines = []
+    for target in target_updates:
+        summary_line = dict(run_summary_info)
+        summary_line.update(target_summary_info[target])
+        summary_content_lines.append(summary_line)
+
+    if low_memory:
+        print(f"Peak RSS ({os.path.basename(run_path)}): {utils.peak_rss_mb():.1f} MB")
+
+    ########################################
+    # Format time series data for this run
+    if not collect_time_series:
+        return (summary_content_lines, None, [], file_stats, packed_task_grids)
+    # Order the updates
+    time_series_update_order = list(time_series_updates)
+    time_series_update_order.sort()
+    # Order the fields
+    time_series_fields = list(time_series_info[time_series_update_order[0]].keys())
+    time_series_fields.sort()
+    time_series_content = []
+    for u in time_series_update_order:
+        time_series_content.append(",".join([str(time_series_info[u][field]) for field in time_series_fields]))
+
+    return (summary_content_lines, time_series_fields, time_series_content, file_stats, packed_task_grids)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Aggregate data from avida runs.")
+    parser.add_argument("--spec", type=str, default=None, help="Aggregation specification file (.json) that describes which files / fields to pull from each run")
+    parser.add_argument("--data_dir", type=str, help="Where is the base output directory for each run?")
+    parser.add_argument("--dump_dir", type=str, help="Where to dump this?", default=".")
+    parser.add_argument("--summary_update", type=int, help="Update to pull summary data for?")
+    parser.add_argument("--summary_updates", type=int, nargs="+", default=[], help="Updates to pull summary data for (one summary row per run per update)")
+    parser.add_argument("--time_series_units", type=str, default="interval", choices=["interval", "total"], help="Unit for resolution of time series")
+    parser.add_argument("--time_series_resolution", type=int, default=1, help="What resolution should we collect time series data at?")
+    parser.add_argument("--summary_only", action="store_true", help="Only output summary data (skips time series; reads only the final rows of each data file where possible)")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes to aggregate runs with")
+    parser.add_argument("--task_grid_format", type=str, default="csv", choices=["csv", "packed"], help="Write task grids as one csv per run (csv) or to a single packed binary file (packed)")
+    parser.add_argument("--search_depth", type=int, default=2, help="How many levels of nested directories (e.g., job-set-N) below data_dir to search for runs")
+    parser.add_argument("--discovery_threads", type=int, default=8, help="Number of threads used to scan directories when discovering runs")
+    parser.add_argument("--incremental", action="store_true", help="Only aggregate runs that are new or changed since the last aggregation (merges into existing output)")
+    parser.add_argument("--checkpoint_interval", type=int, default=0, help="Checkpoint output every N aggregated runs (0 to disable); resume an interrupted aggregation with --incremental")
+    parser.add_argument("--low_memory", action="store_true", help="Write summary rows as runs are aggregated and stream data files (keeping only needed columns); reports peak memory usage")
+
+    args = parser.parse_args()
+    data_dir = args.data_dir
+    dump_dir = args.dump_dir
+    target_updates = set(args.summary_updates)
+    if args.summary_update is not None:
+        target_updates.add(args.summary_update)
+    target_updates = sorted(target_updates)
+    # Time series data is only collected for runs that reached the final target update
+    final_target_update = target_updates[-1] if len(target_updates) > 0 else None
+    time_series_units = args.time_series_units
+    time_series_resolution = args.time_series_resolution
+    summary_only = args.summary_only
+    num_jobs = args.jobs
+    incremental = args.incremental
+    low_memory = args.low_memory
+    checkpoint_interval = args.checkpoint_interval
+    task_grid_format = args.task_grid_format
+
+    if args.spec is not None and not os.path.isfile(args.spec):
+        print(f"Unable to find aggregation spec file: {args.spec}")
+        exit(-1)
+    spec = load_spec(args.spec)
+
+    if not os.path.exists(data_dir):
+        print("Unable to find data directory.")
+        exit(-1)
+
+    if final_target_update is None:
+        print("Must specify at least one summary update")
+        exit(-1)
+
+    # Verify time series resolution >= 1
+    if time_series_resolution < 1:
+        print("Time series resolution must be >= 1")
+        exit(-1)
+
+    if num_jobs < 1:
+        print("Number of jobs must be >= 1")
+        exit(-1)
+
+    if checkpoint_interval < 0:
+        print("Checkpoint interval must be >= 0")
+        exit(-1)
+
+    utils.mkdir_p(dump_dir)
+
+    # Aggregate run directories (loose, nested, or inside .tar/.tar.gz/.zip archives).
+    # - Sorted so that output order is deterministic (regardless of number of jobs).
+    # - Runs without a run_params.csv file did not finish.
+    run_dirs, unfinished_run_dirs = utils.find_run_dirs(
+        data_dir,
+        spec["run_identifier"],
+        require_file = os.path.join("data", "run_params.csv"),
+        max_depth = args.search_depth,
+        threads = args.discovery_threads,
+        cache_path = os.path.join(dump_dir, run_dirs_cache_fname)
+    )
+    print(f"Found {len(run_dirs)} run directories ({len(unfinished_run_dirs)} unfinished).")
+
+    summary_path = os.path.join(dump_dir, "summary.csv")
+    time_series_fpath = os.path.join(dump_dir, f"time_series.csv")
+    manifest_fpath = os.path.join(dump_dir, manifest_fname)
+    progress_log_fpath = os.path.join(dump_dir, progress_log_fname)
+
+    ########################################
+    # Identify which runs need to be (re)processed
+    ########################################
+    # Aggregation settings that must match for previously aggregated output to be reused.
+    manifest_settings = {
+        "spec": spec,
+        "target_updates": target_updates,
+        "time_series_units": time_series_units,
+        "time_series_resolution": time_series_resolution,
+        "summary_only": summary_only,
+        "task_grid_format": task_grid_format
+    }
+    run_signatures = {
+        run_dir:run_input_signature(os.path.join(data_dir, run_dir))
+        for run_dir in run_dirs
+    }
+    prev_manifest_runs = {}
+    required_outputs = [summary_path] + ([] if summary_only else [time_series_fpath])
+    packed_task_grids = spec["task_grids"] and task_grid_format == "packed"
+    task_grids_dir = os.path.join(dump_dir, "task_grids")
+    packed_task_grids_fpath = os.path.join(task_grids_dir, utils.packed_task_grids_fname)
+    if packed_task_grids:
+        required_outputs += [
+            packed_task_grids_fpath,
+            os.path.join(task_grids_dir, utils.packed_task_grids_index_fname)
+        ]
+    if incremental and all(os.path.isfile(path) for path in required_outputs):
+        prev_manifest_runs = read_manifest_runs(manifest_fpath, manifest_settings)
+    # Runs whose input files are unchanged since they were last aggregated
+    kept_run_dirs = {
+        run_dir
+        for run_dir in run_dirs
+        if (run_dir in prev_manifest_runs) and (prev_manifest_runs[run_dir]["files"] == run_signatures[run_dir])
+    }
+    kept_seeds = {prev_manifest_runs[run_dir]["seed"] for run_dir in kept_run_dirs}
+    process_run_dirs = [run_dir for run_dir in run_dirs if run_dir not in kept_run_dirs]
+    if incremental:
+        print(f"Reusing previously aggregated data for {len(kept_run_dirs)} unchanged runs.")
+        print(f"Aggregating {len(process_run_dirs)} new or changed runs.")
+
+    # Collect previously aggregated summary lines for unchanged runs. Indexed by seed.
+    # - In low-memory mode, summary lines are written out as they are produced
+    #   (unchanged runs first, then runs as they are aggregated).
+    kept_summary_lines = {seed:[] for seed in kept_seeds}
+    summary_header = None   # Holds the summary file header (low-memory mode only)
+    summary_fp = None
+    if low_memory:
+        summary_fp = open(summary_path + ".tmp", "w")
+    if len(kept_run_dirs) > 0:
+        for line in utils.iter_csv(summary_path):
+            if line["seed"] not in kept_seeds:
+                continue
+            if low_memory:
+                summary_header = write_summary_line(summary_fp, summary_header, line)
+            else:
+                kept_summary_lines[line["seed"]].append(line)
+
+    # Create file to hold time series data
+    time_series_content = []    # This will hold all the lines to write out for a single run; written out for each run.
+    time_series_header = None   # Holds the time series file header (verified for consistency across runs)
+
+    if not summary_only:
+        # Carry over previously aggregated time series lines for unchanged runs.
+        # - Streamed line-by-line into a temporary file that replaces the old file.
+        wrote_kept_time_series = False
+        with open(time_series_fpath + ".tmp", "w") as out_fp:
+            if len(kept_run_dirs) > 0:
+                with open(time_series_fpath, "r") as fp:
+                    time_series_header = fp.readline().strip()
+                    num_fields = len(time_series_header.split(","))
+                    seed_i = time_series_header.split(",").index("seed")
+                    for line in fp:
+                        line = line.strip()
+                        line_fields = line.split(",")
+                        # Skip lines from runs that were not kept (or partially written
+                        # lines from an interrupted aggregation).
+                        if (len(line_fields) != num_fields) or (line_fields[seed_i] not in kept_seeds):
+                            continue
+                        if not wrote_kept_time_series:
+                            out_fp.write(time_series_header)
+                            wrote_kept_time_series = True
+                        out_fp.write("\n")
+                        out_fp.write(line)
+        os.replace(time_series_fpath + ".tmp", time_series_fpath)
+        if not wrote_kept_time_series:
+            time_series_header = None
+
+    if packed_task_grids:
+        # Carry over previously packed task grids for unchanged runs.
+        # - Task grids for aggregated runs are appended to the packed file as runs finish.
+        #   The index is written at each checkpoint (and at the end).
+        utils.mkdir_p(task_grids_dir)
+        packed_task_grids_index = []
+        packed_task_grids_offset = 0
+        with open(packed_task_grids_fpath + ".tmp", "wb") as out_fp:
+            if len(kept_run_dirs) > 0:
+                prev_packed_task_grids = np.memmap(packed_task_grids_fpath, dtype=np.uint8, mode="r")
+                for row in utils.read_packed_task_grids_index(task_grids_dir):
+                    if row["seed"] not in kept_seeds:
+                        continue
+                    packed = utils.read_packed_task_grid(task_grids_dir, row, prev_packed_task_grids)
+                    out_fp.write(packed.tobytes())
+                    row["record"] = len(packed_task_grids_index)
+                    row["offset"] = packed_task_grids_offset
+                    packed_task_grids_offset += packed.size
+                    packed_task_grids_index.append(row)
+                del prev_packed_task_grids
+        os.replace(packed_task_grids_fpath + ".tmp", packed_task_grids_fpath)
+        utils.write_packed_task_grids_index(task_grids_dir, packed_task_grids_index)
+
+    settings = {
+        "spec": spec,
+        "dump_dir": dump_dir,
+        "target_updates": target_updates,
+        "time_series_units": time_series_units,
+        "time_series_resolution": time_series_resolution,
+        "summary_only": summary_only,
+        "low_memory": low_memory,
+        "task_grid_format": task_grid_format
+    }
+    run_paths = [os.path.join(data_dir, run_dir) for run_dir in process_run_dirs]
+    pool = None
+    if num_jobs > 1:
+        # Index archives once here; forked workers share the index instead of re-listing archives
+        utils.load_archive_indexes(run_paths)
+        pool = multiprocessing.Pool(num_jobs)
+        run_results = pool.imap(functools.partial(aggregate_run, settings=settings), run_paths)
+    else:
+        run_results = (aggregate_run(run_path, settings) for run_path in run_paths)
+
+    summary_lines_by_run = {}
+    manifest_runs = {run_dir:prev_manifest_runs[run_dir] for run_dir in kept_run_dirs}
+
+    def write_summary(final=False):
+        if low_memory:
+            # Only replace summary file if summary lines were written (as in normal mode)
+            if final:
+                summary_fp.close()
+                if summary_header is not None:
+                    os.replace(summary_path + ".tmp", summary_path)
+                else:
+                    os.remove(summary_path + ".tmp")
+            elif summary_header is not None:
+                # Checkpoint: copy (summary file is still being written), then swap in atomically
+                summary_fp.flush()
+                shutil.copyfile(summary_path + ".tmp", summary_path + ".checkpoint")
+                os.replace(summary_path + ".checkpoint", summary_path)
+            return
+        # Write summary info out (in run directory order)
+        summary_content_lines = []
+        for run_dir in run_dirs:
+            if run_dir in kept_run_dirs:
+                summary_content_lines.extend(kept_summary_lines[prev_manifest_runs[run_dir]["seed"]])
+            elif run_dir in summary_lines_by_run:
+                summary_content_lines.extend(summary_lines_by_run[run_dir])
+        if len(summary_content_lines) > 0:
+            # Swap in atomically (an interrupted write must not truncate the summary file)
+            utils.write_csv(summary_path + ".tmp", summary_content_lines)
+            os.replace(summary_path + ".tmp", summary_path)
+
+    # Progress log (appended to with --incremental, to keep history from before an interruption)
+    progress_log_fp = open(progress_log_fpath, "a" if incremental else "w")
+    total_file_stats = {}   # Indexed by file type
+    total_bytes = 0
+    start_time = time.perf_counter()
+    write_progress_log_entry(
+        progress_log_fp,
+        {
+            "event": "start",
+            "runs_total": len(run_dirs),
+            "runs_kept": len(kept_run_dirs),
+            "runs_to_aggregate": len(process_run_dirs),
+            "jobs": num_jobs
+        }
+    )
+
+    # For each run directory (results arrive in run directory order)...
+    incomplete_runs = list(unfinished_run_dirs)
+    for run_dir_i, run_result in enumerate(run_results):
+        run_dir = process_run_dirs[run_dir_i]
+        runs_done = run_dir_i + 1
+        elapsed = time.perf_counter() - start_time
+        runs_per_sec = runs_done / elapsed if elapsed > 0 else 0
+        eta = (len(process_run_dirs) - runs_done) / runs_per_sec if runs_per_sec > 0 else 0
+        run_file_stats = {} if run_result is None else run_result[3]
+        add_file_stats(total_file_stats, run_file_stats)
+        total_bytes += sum(run_file_stats[file_type]["bytes"] for file_type in run_file_stats)
+        write_progress_log_entry(
+            progress_log_fp,
+            {
+                "event": "run",
+                "run_dir": run_dir,
+                "finished": run_result is not None,
+                "runs_done": runs_done,
+                "runs_to_aggregate": len(process_run_dirs),
+                "elapsed_sec": elapsed,
+                "runs_per_sec": runs_per_sec,
+                "bytes_read": total_bytes,
+                "bytes_per_sec": total_bytes / elapsed if elapsed > 0 else 0,
+                "eta_sec": eta,
+                "files": run_file_stats
+            }
+        )
+        print(f"...({runs_done}/{len(process_run_dirs)}) aggregated from {run_dir} ({runs_per_sec:.2f} runs/sec, ETA {eta:.0f}s)")
+
+        if run_result is None:
+            incomplete_runs.append(run_dir)
+            continue
+        run_summary_lines, time_series_fields, time_series_content, _, run_packed_task_grids = run_result
+        if low_memory:
+            for line in run_summary_lines:
+                summary_header = write_summary_line(summary_fp, summary_header, line)
+        else:
+            summary_lines_by_run[run_dir] = run_summary_lines
+        manifest_runs[run_dir] = {
+            "seed": run_summary_lines[0]["seed"] if len(run_summary_lines) > 0 else None,
+            "files": run_signatures[run_dir]
+        }
+
+        ############################################################
+        # Output time series data for this run
+        if time_series_fields is not None:
+            # If we haven't written the header, write it.
+            write_header = False
+            if time_series_header == None:
+                write_header = True
+                time_series_header = ",".join(time_series_fields)
+            elif time_series_header != ",".join(time_series_fields):
+                print("Time series header mismatch!")
+                exit(-1)
+
+            # Write time series content line-by-line
+            with open(time_series_fpath, "a") as fp:
+                if write_header:
+                    fp.write(time_series_header)
+                fp.write("\n")
+                fp.write("\n".join(time_series_content))
+            time_series_content = []
+        ############################################################
+
+        # Output packed task grids for this run
+        if len(run_packed_task_grids) > 0:
+            with open(packed_task_grids_fpath, "ab") as fp:
+                for task_grid in run_packed_task_grids:
+                    packed = task_grid.pop("packed")
+                    fp.write(packed.tobytes())
+                    task_grid["record"] = len(packed_task_grids_index)
+                    task_grid["num_cells"] = packed.shape[0]
+                    task_grid["offset"] = packed_task_grids_offset
+                    packed_task_grids_offset += packed.size
+                    packed_task_grids_index.append(task_grid)
+
+        # Checkpoint: output for every run in the manifest is on disk.
+        if checkpoint_interval > 0 and runs_done % checkpoint_interval == 0 and runs_done < len(process_run_dirs):
+            write_summary()
+            if packed_task_grids:
+                utils.write_packed_task_grids_index(task_grids_dir, packed_task_grids_index)
+            write_manifest(manifest_fpath, manifest_settings, manifest_runs)
+            write_progress_log_entry(
+                progress_log_fp,
+                {"event": "checkpoint", "runs_done": runs_done, "runs_in_manifest": len(manifest_runs)}
+            )
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    write_summary(final=True)
+    if packed_task_grids:
+        utils.write_packed_task_grids_index(task_grids_dir, packed_task_grids_index)
+
+    # Record which runs have been aggregated (used by --incremental)
+    write_manifest(manifest_fpath, manifest_settings, manifest_runs)
+
+    elapsed = time.perf_counter() - start_time
+    write_progress_log_entry(
+        progress_log_fp,
+        {
+            "event": "done",
+            "runs_done": len(process_run_dirs),
+            "incomplete_runs": len(incomplete_runs),
+            "elapsed_sec": elapsed,
+            "bytes_read": total_bytes,
+            "bytes_per_sec": total_bytes / elapsed if elapsed > 0 else 0,
+            "files": total_file_stats
+        }
+    )
+    progress_log_fp.close()
+
+    # print time spent reading each type of file (most expensive first)
+    print("Time spent reading files:")
+    for file_type in sorted(total_file_stats, key = lambda ft:total_file_stats[ft]["seconds"], reverse=True):
+        file_type_stats = total_file_stats[file_type]
+        print(f"  {file_type}: {file_type_stats['seconds']:.3f}s ({file_type_stats['files']} files, {file_type_stats['bytes']} bytes)")
+
+    # print incomplete runs
+    print("Incomplete runs:")
+    print("\n".join(incomplete_runs))
+
+    if low_memory:
+        print(f"Peak RSS (main process): {utils.peak_rss_mb():.1f} MB")
+        if pool is not None:
+            print(f"Peak RSS (largest worker): {utils.peak_rss_mb(children=True):.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
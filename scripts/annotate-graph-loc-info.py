@@ -1,7 +1,7 @@
 '''
 This script takes the following inputs:
 - summary.csv (generated with aggregate.py script)
-- graph_birth_info.csv (generated with aggregate-graph-loc-info.py script)
+- graph_birth_info.csv or graph_birth_info.npz (generated with aggregate-graph-loc-info.py script)
 
 and annotates each location in graph_birth_info with extra information:
 - expected births (proportion and raw value given total births)
@@ -36,9 +36,11 @@ def task_name(in_name):
 def main():
     parser = argparse.ArgumentParser(description="Screen for hotspots")
     parser.add_argument("--summary_data", type=str, help="Summary data file that contains task appearance data.")
-    parser.add_argument("--graph_birth_data", type=str, help="Summary data file containing graph birth location data.")
+    parser.add_argument("--graph_birth_data", type=str, help="Summary data file containing graph birth location data (.csv or births matrix .npz).")
     parser.add_argument("--graphs_dir", type=str, help="Path to directory containing relevant graphs")
     parser.add_argument("--dump_dir", type=str, default=".", help="Where to write output files")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes used to read graph files")
+    parser.add_argument("--target_update", type=int, default=None, help="Which summary update (target_update) to use if summary has rows for multiple updates (defaults to each run's final update)")
 
     args = parser.parse_args()
     summary_data_path = args.summary_data
@@ -58,8 +60,13 @@ def main():
 
     # Read summary file
     summary_data = utils.read_csv(summary_data_path)
+    # Summary may have one row per run per summary update; keep one row per run
+    summary_data = utils.filter_summary_target_update(summary_data, args.target_update)
+    if len(summary_data) == 0:
+        print(f"No summary data for target update: {args.target_update}")
+        exit(-1)
     # Read graph birth location data
-    graph_birth_loc_data = utils.read_csv(birth_locs_data_path)
+    graph_birth_loc_data = utils.read_graph_birth_data(birth_locs_data_path)
 
     # We can key off of seeds in summary / graph birth loc data to cross reference.
     seeds = [line["seed"] for line in summary_data]
@@ -80,10 +87,6 @@ def main():
     # Identify seeds by graph file
     graph_file_seeds = {}
 
-    # For each run (seed), idenfity task appearance locations
-    #  {seed: {loc: task_appearances, ...}, ...}
-    # NOTE: not all locations will be represented; only those where tasks appeared
-    total_task_appearances_by_loc = {seed:{} for seed in seeds}
     for line in summary_data:
         run_seed = line["seed"]
 
@@ -94,47 +97,23 @@ def main():
                 graph_file_seeds[graph_file] = []
             graph_file_seeds[graph_file].append(run_seed)
 
-        for task in tasks:
-            tname = task_name(task)
-            task_completed = (line[f"task_loc_{tname}_completed"] == "1") and not ((line[f"task_loc_{tname}_loc_id"] == "-1"))
-            if not task_completed:
-                continue
-            task_loc_id = int(line[f"task_loc_{tname}_loc_id"])
-            # Is task location in dictionary yet? If not, add it.
-            if not task_loc_id in total_task_appearances_by_loc[run_seed]:
-                total_task_appearances_by_loc[run_seed][task_loc_id] = 0
-            total_task_appearances_by_loc[run_seed][task_loc_id] += 1
-
-    # for seed in total_task_appearances_by_loc:
-    #     print(seed, total_task_appearances_by_loc[seed])
-    # exit(-1)
-
-    # Map each seed to its graph file
-    seed_to_graph_file = {
-        seed:graph_file
-        for seed in graph_file_seeds[graph_file]
-        for graph_file in graph_file_seeds
-    }
-
-    # Total task appearances for each run
-    total_task_appearances_by_seed = {
-        seed:sum(
-            [
-                total_task_appearances_by_loc[seed][loc]
-                for loc in total_task_appearances_by_loc[seed]
-            ]
-        )
-        for seed in total_task_appearances_by_loc
-    }
-    # print(total_task_appearances_by_loc)
-    # print(total_task_appearances_by_seed)
-    # Proportion task appearances by location by seed
-    prop_task_appearances_by_loc = {seed:{} for seed in seeds}
-    for seed in total_task_appearances_by_loc:
-        task_apps_by_loc = total_task_appearances_by_loc[seed]
-        total_task_apps = total_task_appearances_by_seed[seed]
-        for loc in task_apps_by_loc:
-            prop_task_appearances_by_loc[seed][loc] = task_apps_by_loc[loc] / total_task_apps if total_task_apps > 0 else 0
+    # For each run (seed), count task appearances by location
+    # - (runs x tasks) array of first appearance locations (-1 if task not completed)
+    task_locs = utils.read_first_task_locs(summary_data, [task_name(task) for task in tasks])
+    num_locs = max(int(task_locs.max()) + 1, 1)
+    seed_index = {seed:i for i, seed in enumerate(seeds)}
+    # (runs x locs) task appearances by location, total task appearances for each run
+    task_appearances_by_loc = utils.count_locs(task_locs, num_locs)
+    total_task_appearances_by_seed = task_appearances_by_loc.sum(axis=1)
+
+    def task_appearances(seed, loc):
+        run_i = seed_index[seed]
+        return task_appearances_by_loc[run_i, loc].item() if loc < num_locs else 0
+
+    def task_appearances_prop(seed, loc):
+        # Locations without any task appearances are given 0
+        count = task_appearances(seed, loc)
+        return count / total_task_appearances_by_seed[seed_index[seed]].item() if count > 0 else 0
 
     # Total actual births by seed
     total_births_by_seed = {seed:0 for seed in seeds}
@@ -151,28 +130,29 @@ def main():
         total_births = total_births_by_seed[graph_seed]
         prop_births_by_loc[graph_seed][loc] = loc_births / total_births
 
-    # Expected births (will need to load graph)
-    graph_expected_births_info = {}
+    # Expected births (graph files are read straight into sparse adjacency matrices)
     for graph_file in graph_file_seeds:
-        # run_seeds = graph_file_seeds[graph_file]
         graph_path = os.path.join(graphs_dir, graph_file)
         if not os.path.isfile(graph_path):
             print(f"Failed to find graph file: {graph_path}")
-        # Load graph
-        graph = gutils.read_graph_matrix(graph_path)
-        # Calculate expected births for this graph
-        graph_expected_births_info[graph_file] = gutils.calc_expected_births(graph)
+            exit(-1)
+    # {graph file: (expected births, proportion expected births)}
+    graph_expected_births_info = gutils.calc_expected_births_batch(
+        graphs_dir,
+        list(graph_file_seeds.keys()),
+        jobs = args.jobs
+    )
 
     # Build output (reuse graph data)
     for line in graph_birth_loc_data:
         graph_file = line["graph_file"]
         seed = line["seed"]
         loc_id = line["loc_id"]
-        line["expected_births_prop"] = graph_expected_births_info[graph_file][int(loc_id)]["prop_births"]
+        line["expected_births_prop"] = graph_expected_births_info[graph_file][1][int(loc_id)].item()
         line["expected_births_total"] = total_births_by_seed[seed] * line["expected_births_prop"]
         line["births_prop"] = prop_births_by_loc[seed][loc_id]
-        line["task_appearances"] = total_task_appearances_by_loc[seed].get(int(loc_id), 0)
-        line["task_appearances_prop"] = prop_task_appearances_by_loc[seed].get(int(loc_id), 0)
+        line["task_appearances"] = task_appearances(seed, int(loc_id))
+        line["task_appearances_prop"] = task_appearances_prop(seed, int(loc_id))
 
     # Output
     basename = os.path.basename(birth_locs_data_path).split(".")[0]
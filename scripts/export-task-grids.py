@@ -0,0 +1,50 @@
+'''
+Export packed task grids (written by aggregate.py --task_grid_format packed) back out to
+per-seed csv files (task_loc_info_<seed>.csv), identical to those written by aggregate.py
+with --task_grid_format csv.
+'''
+
+import argparse
+import numpy as np
+import os
+import utilities as utils
+
+def main():
+    parser = argparse.ArgumentParser(description = "Export packed task grids to per-seed csv files.")
+    parser.add_argument("--task_grids_dir", type=str, help="Directory with packed task grids (task_profiles.bin, task_profiles_index.csv)")
+    parser.add_argument("--dump_dir", type=str, default=None, help="Where to write csv files? (defaults to task_grids_dir)")
+    parser.add_argument("--seeds", type=str, nargs="+", default=None, help="Only export task grids for these seeds")
+
+    args = parser.parse_args()
+    task_grids_dir = args.task_grids_dir
+    dump_dir = task_grids_dir if args.dump_dir is None else args.dump_dir
+    seeds = None if args.seeds is None else set(args.seeds)
+
+    if not os.path.isfile(os.path.join(task_grids_dir, utils.packed_task_grids_index_fname)):
+        print("Unable to find packed task grids.")
+        exit(-1)
+
+    utils.mkdir_p(dump_dir)
+
+    index = utils.read_packed_task_grids_index(task_grids_dir)
+    packed_grids = np.memmap(
+        os.path.join(task_grids_dir, utils.packed_task_grids_fname),
+        dtype=np.uint8,
+        mode="r"
+    )
+    export_rows = [row for row in index if (seeds is None) or (row["seed"] in seeds)]
+    for row_i in range(len(export_rows)):
+        row = export_rows[row_i]
+        print(f"...({row_i + 1}/{len(export_rows)}) exporting {row['csv_name']}")
+        profiles = utils.unpack_task_grid(
+            utils.read_packed_task_grid(task_grids_dir, row, packed_grids),
+            row["num_tasks"]
+        )
+        task_grid_data = {
+            loc_id:{"loc_id": loc_id, "task_profile": profiles[loc_id]}
+            for loc_id in range(len(profiles))
+        }
+        utils.write_task_grid_data(os.path.join(dump_dir, row["csv_name"]), task_grid_data)
+
+if __name__ == "__main__":
+    main()
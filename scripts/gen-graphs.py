@@ -5,6 +5,7 @@ requested graph files.
 import argparse
 import json
 import os
+import networkx as nx
 import graph_generators as ggen
 import utilities as utils
 import graph_utilities as gutils
@@ -139,6 +140,7 @@ def main():
     parser.add_argument("-l", "--list_graphs", action="store_true", help="List all available graphs (does not run generators).")
     parser.add_argument("-o", "--overwrite", action="store_true", help="If output file with exact same name exists in dump directory, regenerate and overwrite.")
     parser.add_argument("--name_with_seed", action="store_true", help="Should output files w/count > 1 be differentiated with seed or consecutive ids, starting at 0")
+    parser.add_argument("--spectral_summary", action="store_true", help="Write Kemeny constant, spectral gap, and algebraic connectivity of each generated graph to graph_spectral_summary.csv")
 
     args = parser.parse_args()
 
@@ -165,6 +167,7 @@ def main():
     if "graphs-to-generate" not in config:
         print("Failed to find 'graphs-to-generate' list in configuration.")
         exit(-1)
+    spectral_summary = []
     for graph_cfg in config["graphs-to-generate"]:
         graph_name = graph_cfg["graph"]
         generator = ggen.get_generator_fun(graph_name)
@@ -220,5 +223,16 @@ def main():
             print(f"  - Num edges in graph: {len(graph.edges)}")
             output_modes[mode]["write_fun"](out_path, graph)
 
+            if args.spectral_summary:
+                summary = {"graph_file": out_name, "num_nodes": len(graph), "num_edges": len(graph.edges)}
+                is_connected = len(graph) > 0 and nx.is_connected(graph)
+                summary["kemeny_constant"] = gutils.calc_kemeny_constant(graph) if is_connected else "error"
+                summary.update(gutils.calc_spectral_summary(graph))
+                print(f"  - Kemeny constant: {summary['kemeny_constant']}, spectral gap: {summary['spectral_gap']}, algebraic connectivity: {summary['algebraic_connectivity']}")
+                spectral_summary.append(summary)
+
+    if args.spectral_summary:
+        utils.write_csv(os.path.join(args.dump_dir, "graph_spectral_summary.csv"), spectral_summary)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,319 @@
+'''
+Node centralities of (undirected, unweighted) graphs computed on sparse (csr) adjacency
+matrices. Values match the networkx functions of the same name (closeness, harmonic,
+eigenvector, information, subgraph, load, and second order centrality, triangles, and
+clustering). BFS-based centralities (closeness, harmonic, load) and subgraph centrality are
+computed over chunks of source nodes, which can be spread over a pool of worker processes.
+'''
+
+import multiprocessing
+import networkx as nx
+import numpy as np
+import scipy.sparse as sparse
+from scipy.sparse import csgraph
+import scipy.sparse.linalg as splinalg
+
+centrality_names = [
+    "closeness_centrality",
+    "harmonic_centrality",
+    "load_centrality",
+    "eigenvector_centrality",
+    "subgraph_centrality",
+    "information_centrality",
+    "second_order_centrality",
+    "triangles",
+    "clustering"
+]
+
+# Graphs at least this dense (edges / possible edges) use dense matrix routines
+dense_density = 0.05
+# BFS-based centralities use dense matrix products (one per BFS level) when
+# (number of BFS levels) < dense_bfs_level_ratio * density
+dense_bfs_level_ratio = 100
+# Max number of (source, edge) entries held at once by load centrality BFS chunks
+max_chunk_entries = 2**22
+
+def adjacency_matrix(graph:nx.Graph):
+    '''
+    Unweighted (float, csr) adjacency matrix of graph without self-loops; rows / columns
+    ordered by sorted node id. Returns (adjacency matrix, node order).
+    '''
+    nodes = sorted(graph.nodes())
+    adjacency = nx.to_scipy_sparse_array(graph, nodelist=nodes, weight=None, format="csr", dtype=float)
+    adjacency.setdiag(0)
+    adjacency.eliminate_zeros()
+    adjacency.data[:] = 1
+    return (adjacency, nodes)
+
+def density(adjacency):
+    n = adjacency.shape[0]
+    return adjacency.nnz / (n * (n - 1)) if n > 1 else 0.0
+
+def is_dense(adjacency):
+    return density(adjacency) >= dense_density
+
+def use_dense_bfs(adjacency):
+    '''
+    Whether BFS from every node is cheaper with dense matrix products than with sparse neighbor
+    lists, estimating the number of BFS levels by the eccentricity of the highest degree node.
+    '''
+    if adjacency.shape[0] < 2:
+        return False
+    degrees = np.diff(adjacency.indptr)
+    eccentricity = bfs_levels(adjacency, [np.argmax(degrees)]).max()
+    return bool(eccentricity < dense_bfs_level_ratio * density(adjacency))
+
+def _load_contributions(adjacency, levels, sources):
+    '''
+    Load (Newman's betweenness) through each node summed over the given sources, from BFS
+    levels (distance from each source; -1 if unreachable) (sources x nodes). Each target
+    sends one unit (+ the load it received) back toward the source, split evenly among its
+    predecessors (neighbors one level closer to the source).
+    Dense adjacency matrices are processed one level at a time with matrix products; sparse
+    ones by expanding the neighbor lists of each level's nodes.
+    '''
+    num_sources, n = levels.shape
+    max_level = int(levels.max(initial=0))
+    if isinstance(adjacency, np.ndarray):
+        load = np.zeros((num_sources, n))
+        for level in range(max_level, 0, -1):
+            at_level = levels == level
+            prev_level = (levels == level - 1).astype(float)
+            num_preds = prev_level @ adjacency
+            flow = np.divide(1 + load, num_preds, out=np.zeros_like(load), where=at_level)
+            load += prev_level * (flow @ adjacency)
+        load[np.arange(num_sources), sources] = 0
+        return load.sum(axis=0)
+    # Flat (source x node) indices of entries at each level
+    flat_levels = levels.ravel()
+    order = np.argsort(flat_levels, kind="stable")
+    bounds = np.searchsorted(flat_levels[order], np.arange(max_level + 2))
+    indptr, indices = adjacency.indptr, adjacency.indices
+    degrees = np.diff(indptr)
+    # Forward: predecessor edges (target, predecessor, share of target's flow) of each level
+    pred_edges = [None] * (max_level + 1)
+    for level in range(1, max_level + 1):
+        entries = order[bounds[level]:bounds[level + 1]]
+        rows, targets = np.divmod(entries, n)
+        counts = degrees[targets]
+        offsets = np.cumsum(counts) - counts
+        positions = np.arange(counts.sum()) - np.repeat(offsets, counts) + np.repeat(indptr[targets], counts)
+        neighbors = np.repeat(rows, counts) * n + indices[positions]
+        is_pred = flat_levels[neighbors] == level - 1
+        num_preds = np.add.reduceat(is_pred, offsets)
+        pred_edges[level] = (
+            np.repeat(entries, counts)[is_pred],
+            neighbors[is_pred],
+            np.repeat(1 / num_preds, counts)[is_pred]
+        )
+    # Backward: pass flow from deepest level toward sources
+    load = np.zeros(num_sources * n)
+    for level in range(max_level, 0, -1):
+        targets, preds, shares = pred_edges[level]
+        np.add.at(load, preds, (1 + load[targets]) * shares)
+    load = load.reshape(num_sources, n)
+    load[np.arange(num_sources), sources] = 0
+    return load.sum(axis=0)
+
+def bfs_levels(adjacency, sources):
+    '''
+    BFS level (distance) of every node from each source (-1 if unreachable) (sources x nodes).
+    Dense adjacency matrices are searched one level at a time with matrix products.
+    '''
+    if not isinstance(adjacency, np.ndarray):
+        # Adjacency is symmetric, so directed search gives the same distances (without a csc copy)
+        dists = csgraph.shortest_path(adjacency, method="D", directed=True, unweighted=True, indices=sources)
+        return np.where(np.isfinite(dists), dists, -1).astype(np.int64)
+    levels = np.full((len(sources), adjacency.shape[0]), -1, dtype=np.int64)
+    levels[np.arange(len(sources)), sources] = 0
+    frontier = (levels == 0).astype(float)
+    level = 0
+    while frontier.any():
+        level += 1
+        reached = ((frontier @ adjacency) > 0) & (levels < 0)
+        levels[reached] = level
+        frontier = reached.astype(float)
+    return levels
+
+def _distance_centrality_chunk(adjacency, sources):
+    '''
+    BFS from each source. Returns (closeness of sources, harmonic centrality of sources,
+    load through each node summed over sources).
+    '''
+    n = adjacency.shape[0]
+    levels = bfs_levels(adjacency, sources)
+    reachable = levels >= 0
+    # Closeness (Wasserman and Faust scaling for graphs that are not connected)
+    num_reachable = reachable.sum(axis=1) - 1
+    total_dist = levels.sum(axis=1, where=reachable, initial=0)
+    closeness = np.divide(
+        num_reachable * num_reachable,
+        total_dist * max(n - 1, 1),
+        out=np.zeros(len(sources)),
+        where=total_dist > 0
+    )
+    harmonic = np.divide(1.0, levels, out=np.zeros(levels.shape), where=levels > 0).sum(axis=1)
+    return (closeness, harmonic, _load_contributions(adjacency, levels, sources))
+
+def _subgraph_centrality_chunk(adjacency, block):
+    '''
+    Subgraph centrality (diagonal of the matrix exponential of adjacency) of nodes in block.
+    '''
+    n = adjacency.shape[0]
+    identity_block = np.zeros((n, len(block)))
+    identity_block[block, np.arange(len(block))] = 1
+    return splinalg.expm_multiply(adjacency, identity_block)[block, np.arange(len(block))]
+
+# Adjacency matrix used by centrality worker processes (set by _init_centrality_worker)
+_centrality_adjacency = None
+
+def _init_centrality_worker(adjacency):
+    global _centrality_adjacency
+    _centrality_adjacency = adjacency
+
+def _centrality_chunk(kind, chunk, adjacency=None):
+    adjacency = _centrality_adjacency if adjacency is None else adjacency
+    if kind == "distance":
+        return _distance_centrality_chunk(adjacency, chunk)
+    return _subgraph_centrality_chunk(adjacency, chunk)
+
+def calc_eigenvector_centrality(adjacency):
+    '''
+    Leading (Perron) eigenvector of adjacency, normalized to unit length.
+    '''
+    n = adjacency.shape[0]
+    if n < 64:
+        vector = np.linalg.eigh(adjacency.toarray() if sparse.issparse(adjacency) else adjacency)[1][:, -1]
+    else:
+        vector = splinalg.eigsh(adjacency, k=1, which="LA", v0=np.ones(n))[1][:, 0]
+    vector = np.abs(vector)
+    return vector / (np.linalg.norm(vector) or 1)
+
+def calc_grounded_laplacian_inverse(adjacency, block_size=256):
+    '''
+    Diagonal and row sums of C, the inverse of the Laplacian with its highest degree node
+    removed (grounded), padded with zeros for the removed node.
+    Blocked solves with a sparse LU factorization (dense inverse for dense graphs).
+    '''
+    n = adjacency.shape[0]
+    degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+    keep = np.delete(np.arange(n), np.argmax(degrees))
+    diagonal = np.zeros(n)
+    row_sums = np.zeros(n)
+    if isinstance(adjacency, np.ndarray):
+        laplacian = np.diag(degrees) - adjacency
+        inverse = np.linalg.inv(laplacian[np.ix_(keep, keep)])
+        diagonal[keep] = np.diag(inverse)
+        row_sums[keep] = inverse.sum(axis=1)
+        return (diagonal, row_sums)
+    laplacian = sparse.csc_array(sparse.diags_array(degrees) - adjacency)
+    lu = splinalg.splu(sparse.csc_array(laplacian[keep][:, keep]))
+    kept_diagonal = np.zeros(n - 1)
+    for block_start in range(0, n - 1, block_size):
+        block = np.arange(block_start, min(n - 1, block_start + block_size))
+        rhs = np.zeros((n - 1, len(block)))
+        rhs[block, np.arange(len(block))] = 1
+        kept_diagonal[block] = lu.solve(rhs)[block, np.arange(len(block))]
+    diagonal[keep] = kept_diagonal
+    row_sums[keep] = lu.solve(np.ones(n - 1))
+    return (diagonal, row_sums)
+
+def calc_triangles(adjacency, block_size=256):
+    '''
+    Number of triangles through each node: row sums of (A @ A) * A / 2, by blocks of rows.
+    '''
+    n = adjacency.shape[0]
+    triangles = np.zeros(n)
+    for block_start in range(0, n, block_size):
+        rows = adjacency[block_start:block_start + block_size]
+        if isinstance(adjacency, np.ndarray):
+            triangles[block_start:block_start + block_size] = ((rows @ adjacency) * rows).sum(axis=1)
+        else:
+            triangles[block_start:block_start + block_size] = (rows @ adjacency).multiply(rows).sum(axis=1)
+    return triangles / 2
+
+def calc_node_centralities(graph:nx.Graph, jobs=1, chunk_size=256, centralities=None):
+    '''
+    Node centralities (centrality_names, or just those in centralities) of graph.
+    Returns {centrality name: {node: value}}.
+    Information and second order centrality are only defined for connected graphs (NaN
+    otherwise); eigenvector centrality of a graph that is not connected is the leading
+    eigenvector of one component.
+    '''
+    centralities = centrality_names if centralities is None else centralities
+    adjacency, nodes = adjacency_matrix(graph)
+    n = len(nodes)
+    dense = is_dense(adjacency)
+    # Adjacency used by chunks (BFS / matrix exponential)
+    chunk_adjacency = adjacency.toarray() if dense or use_dense_bfs(adjacency) else adjacency
+    if dense:
+        adjacency = chunk_adjacency
+    degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+    results = {}
+    ############################################################
+    # Chunked (BFS / matrix exponential) centralities
+    ############################################################
+    chunk_tasks = []
+    if any(name in centralities for name in ["closeness_centrality", "harmonic_centrality", "load_centrality"]):
+        # Load centrality holds (sources x edges) entries per chunk
+        source_chunk_size = chunk_size if isinstance(chunk_adjacency, np.ndarray) else int(np.clip(max_chunk_entries // max(adjacency.nnz, 1), 1, chunk_size))
+        chunk_tasks += [("distance", np.arange(i, min(i + source_chunk_size, n))) for i in range(0, n, source_chunk_size)]
+    # Sparse matrix exponential needs many steps for dense graphs / graphs with high degree nodes
+    subgraph_dense = dense or (degrees.max(initial=0) * adjacency.nnz > n * n)
+    if "subgraph_centrality" in centralities and not subgraph_dense:
+        chunk_tasks += [("subgraph", np.arange(i, min(i + chunk_size, n))) for i in range(0, n, chunk_size)]
+    if jobs > 1 and len(chunk_tasks) > 1:
+        with multiprocessing.Pool(jobs, initializer=_init_centrality_worker, initargs=(chunk_adjacency,)) as pool:
+            chunk_results = pool.starmap(_centrality_chunk, chunk_tasks)
+    else:
+        chunk_results = [_centrality_chunk(kind, chunk, chunk_adjacency) for kind, chunk in chunk_tasks]
+    distance_results = [result for (kind, _), result in zip(chunk_tasks, chunk_results) if kind == "distance"]
+    if distance_results:
+        results["closeness_centrality"] = np.concatenate([result[0] for result in distance_results])
+        results["harmonic_centrality"] = np.concatenate([result[1] for result in distance_results])
+        load = np.sum([result[2] for result in distance_results], axis=0)
+        results["load_centrality"] = load / ((n - 1) * (n - 2)) if n > 2 else load
+    if "subgraph_centrality" in centralities:
+        if subgraph_dense:
+            eigenvalues, eigenvectors = np.linalg.eigh(adjacency if dense else adjacency.toarray())
+            with np.errstate(over="ignore"):
+                results["subgraph_centrality"] = (eigenvectors ** 2) @ np.exp(eigenvalues)
+        else:
+            results["subgraph_centrality"] = np.concatenate(
+                [result for (kind, _), result in zip(chunk_tasks, chunk_results) if kind == "subgraph"]
+            )
+    ############################################################
+    # Spectral centralities
+    ############################################################
+    if "eigenvector_centrality" in centralities:
+        results["eigenvector_centrality"] = calc_eigenvector_centrality(adjacency)
+    if any(name in centralities for name in ["information_centrality", "second_order_centrality"]):
+        if n > 1 and csgraph.connected_components(adjacency, directed=False)[0] == 1:
+            diagonal, row_sums = calc_grounded_laplacian_inverse(adjacency)
+            # Sum of resistance distances from each node
+            resistance = n * diagonal - 2 * row_sums + diagonal.sum()
+            results["information_centrality"] = 1 / resistance
+            # Second order centrality from the diagonal of the Laplacian pseudo-inverse:
+            # sqrt(2 n^2 d_max L+_ii + n - n^2)
+            pinv_diagonal = diagonal - 2 * row_sums / n + row_sums.sum() / (n * n)
+            results["second_order_centrality"] = np.sqrt(np.maximum(2 * n * n * degrees.max() * pinv_diagonal + n - n * n, 0))
+        else:
+            results["information_centrality"] = np.full(n, np.nan)
+            results["second_order_centrality"] = np.full(n, np.nan)
+    ############################################################
+    # Triangles / clustering
+    ############################################################
+    if any(name in centralities for name in ["triangles", "clustering"]):
+        triangles = calc_triangles(adjacency)
+        results["triangles"] = triangles.round().astype(np.int64)
+        results["clustering"] = np.divide(
+            2 * triangles,
+            degrees * (degrees - 1),
+            out=np.zeros(n),
+            where=degrees > 1
+        )
+    return {
+        name: {node: values[i].item() for i, node in enumerate(nodes)}
+        for name, values in results.items()
+        if name in centralities
+    }
@@ -1,4 +1,15 @@
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
 import networkx as nx
+from networkx.algorithms import connectivity as nx_connectivity
+from networkx.algorithms.flow import build_residual_network
+import numpy as np
+import scipy.sparse as sparse
+from scipy.sparse import csgraph
+import scipy.sparse.linalg as splinalg
 import utilities as utils
 
 def read_graph_matrix(file_path:str, directed=False):
@@ -124,20 +135,406 @@ def write_node_info(output_path:str, graph:nx.Graph):
     utils.write_csv(output_path, lines)
 
 
-def calc_expected_births(graph:nx.Graph, self_replace=True):
-    expected_births = {node:{"expected_births":0, "prop_births":0} for node in graph.nodes}
-    for node in graph.nodes:
-        for neighbor in graph.neighbors(node):
-            expected_births[node]["expected_births"] += (1 / graph.degree[neighbor])
-        if self_replace:
-            expected_births[node]["expected_births"] += (1 / graph.degree[node])
+def read_graph_matrix_csr(file_path:str, directed=False, weighted=False):
+    '''
+    Read graph saved in matrix format directly into a sparse (csr) adjacency matrix (row /
+    column i is node i), without building a networkx graph. Edges are positive entries
+    (weighted by entry value if weighted). Undirected graphs are symmetrized, as in
+    read_graph_matrix.
+    '''
+    matrix = np.loadtxt(file_path, delimiter=",", dtype=np.int64, ndmin=2)
+    if matrix.shape[0] != matrix.shape[1]:
+        print("Matrix not square.")
+        raise RuntimeError
+    adjacency = sparse.csr_array(np.where(matrix > 0, matrix if weighted else 1, 0).astype(float))
+    if not directed:
+        adjacency = sparse.csr_array(adjacency.maximum(adjacency.T))
+    return adjacency
+
+def calc_expected_births_vector(adjacency, self_replace=True, directed=False):
+    '''
+    Expected births at each node from an (optionally weighted) adjacency matrix, where
+    adjacency[i, j] is the weight of the edge from i to j (offspring of i are placed at j).
+    Each node sends its births to out-neighbors in proportion to edge weight, so expected
+    births = A^T (1 / out strength) (+ 1 / out strength if self_replace).
+    Undirected self-loops count twice toward strength (as in networkx degree).
+    Returns (expected births, proportion of expected births).
+    '''
+    adjacency = sparse.csr_array(adjacency, dtype=float)
+    strengths = np.asarray(adjacency.sum(axis=1)).ravel()
+    if not directed:
+        strengths += adjacency.diagonal()
+    inv_strengths = np.divide(1.0, strengths, out=np.zeros_like(strengths), where=strengths > 0)
+    expected_births = adjacency.T @ inv_strengths
+    if self_replace:
+        expected_births += inv_strengths
+    total = expected_births.sum()
+    prop_births = expected_births / total if total > 0 else np.zeros_like(expected_births)
+    return (expected_births, prop_births)
+
+def adjacency_from_edges(graph:nx.Graph, nodes:list, weight=None):
+    '''
+    Sparse (csr) adjacency matrix of graph (rows / columns in nodes order) built from edge
+    arrays (faster than nx.to_scipy_sparse_array for large graphs). Edge weights are used if
+    weight (edge attribute name) is given; undirected edges are added in both directions.
+    '''
+    index = {node:i for i, node in enumerate(nodes)}
+    num_edges = graph.number_of_edges()
+    edges = np.fromiter(
+        (index[node] for edge in graph.edges() for node in edge),
+        dtype=np.int64,
+        count=2 * num_edges
+    ).reshape(-1, 2)
+    if weight is None:
+        weights = np.ones(num_edges)
+    else:
+        weights = np.fromiter((w for _, _, w in graph.edges(data=weight, default=1)), dtype=float, count=num_edges)
+    rows, cols = edges[:, 0], edges[:, 1]
+    if not graph.is_directed():
+        mirror = rows != cols
+        rows, cols, weights = (
+            np.concatenate([rows, cols[mirror]]),
+            np.concatenate([cols, rows[mirror]]),
+            np.concatenate([weights, weights[mirror]])
+        )
+    return sparse.csr_array((weights, (rows, cols)), shape=(len(nodes), len(nodes)))
+
+def calc_expected_births(graph:nx.Graph, self_replace=True, weight=None):
+    '''
+    Expected births (and proportion of expected births) at each node of graph.
+    Edge weights are used if weight (edge attribute name) is given.
+    Returns {node: {"expected_births": ..., "prop_births": ...}}
+    '''
+    nodes = list(graph.nodes)
+    adjacency = adjacency_from_edges(graph, nodes, weight=weight)
+    expected_births, prop_births = calc_expected_births_vector(
+        adjacency,
+        self_replace = self_replace,
+        directed = graph.is_directed()
+    )
+    return {
+        node:{"expected_births": expected_births[i].item(), "prop_births": prop_births[i].item()}
+        for i, node in enumerate(nodes)
+    }
+
+def _expected_births_file(graph_path:str, self_replace:bool, directed:bool, weighted:bool):
+    adjacency = read_graph_matrix_csr(graph_path, directed=directed, weighted=weighted)
+    return calc_expected_births_vector(adjacency, self_replace=self_replace, directed=directed)
+
+def calc_expected_births_batch(graphs_dir:str, graph_files=None, self_replace=True, directed=False, weighted=False, jobs=1):
+    '''
+    Expected births for every graph (matrix format) file in graphs_dir (e.g., a spatial structs
+    directory), or just those in graph_files. Files are read straight into sparse matrices
+    (spread over jobs worker processes).
+    Returns {graph file: (expected births, proportion of expected births)}, indexed by node id.
+    '''
+    if graph_files is None:
+        graph_files = sorted(f for f in os.listdir(graphs_dir) if f.endswith(".mat"))
+    file_args = [
+        (os.path.join(graphs_dir, graph_file), self_replace, directed, weighted)
+        for graph_file in graph_files
+    ]
+    if jobs > 1 and len(file_args) > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            results = pool.starmap(_expected_births_file, file_args)
+    else:
+        results = [_expected_births_file(*args) for args in file_args]
+    return dict(zip(graph_files, results))
+
+def graph_adjacency_csr(graph:nx.Graph):
+    '''
+    Unweighted (sparse, csr) adjacency matrix of graph; rows / columns ordered by sorted node id.
+    Returns (adjacency matrix, node order).
+    '''
+    nodes = sorted(graph.nodes())
+    adjacency = nx.to_scipy_sparse_array(graph, nodelist=nodes, weight=None, format="csr", dtype=np.int8)
+    return (adjacency, nodes)
+
+# Adjacency matrix used by eccentricity worker processes (set by _init_eccentricity_worker)
+_eccentricity_adjacency = None
+
+def _init_eccentricity_worker(adjacency):
+    global _eccentricity_adjacency
+    _eccentricity_adjacency = adjacency
+
+def _eccentricity_chunk(sources, adjacency=None):
+    '''
+    BFS (unweighted shortest paths) from each source node.
+    Returns (max finite distance from each source, whether each source reaches every node).
+    '''
+    adjacency = _eccentricity_adjacency if adjacency is None else adjacency
+    dists = csgraph.shortest_path(adjacency, method="D", directed=False, unweighted=True, indices=sources)
+    unreachable = np.isinf(dists)
+    dists[unreachable] = -1
+    return (dists.max(axis=1).astype(np.int64), ~unreachable.any(axis=1))
+
+def calc_eccentricities(graph:nx.Graph, jobs=1, chunk_size=256):
+    '''
+    Eccentricity (longest shortest path length to reachable nodes) of every node.
+    Runs BFS from chunks of source nodes (chunks spread over jobs worker processes).
+    Returns (node order, eccentricities, whether each node reaches every other node).
+    '''
+    adjacency, nodes = graph_adjacency_csr(graph)
+    chunks = [np.arange(i, min(i + chunk_size, len(nodes))) for i in range(0, len(nodes), chunk_size)]
+    if jobs > 1 and len(chunks) > 1:
+        with multiprocessing.Pool(jobs, initializer=_init_eccentricity_worker, initargs=(adjacency,)) as pool:
+            results = pool.map(_eccentricity_chunk, chunks)
+    else:
+        results = [_eccentricity_chunk(chunk, adjacency) for chunk in chunks]
+    eccentricities = np.concatenate([result[0] for result in results]) if results else np.zeros(0, dtype=np.int64)
+    reaches_all = np.concatenate([result[1] for result in results]) if results else np.zeros(0, dtype=bool)
+    return (nodes, eccentricities, reaches_all)
+
+def calc_distance_properties(graph:nx.Graph, jobs=1):
+    '''
+    Diameter, radius, and longest shortest path from a single eccentricity pass.
+    Diameter and radius are None if graph is not connected (longest shortest path is over
+    reachable pairs only).
+    '''
+    _, eccentricities, reaches_all = calc_eccentricities(graph, jobs=jobs)
+    is_connected = bool(reaches_all.all()) and len(eccentricities) > 0
+    return {
+        "diameter": int(eccentricities.max()) if is_connected else None,
+        "radius": int(eccentricities.min()) if is_connected else None,
+        "longest_shortest_path": int(eccentricities.max(initial=0))
+    }
 
-    total = sum(expected_births[node]["expected_births"] for node in expected_births)
-    for node in expected_births:
-        expected_births[node]["prop_births"] = expected_births[node]["expected_births"] / total
+def calc_normalized_laplacian(graph:nx.Graph, weight="weight"):
+    '''
+    Sparse (csc) normalized Laplacian (I - D^-1/2 A D^-1/2) of graph. As in
+    nx.normalized_laplacian_matrix, the diagonal is 0 for isolated (degree 0) nodes.
+    Returns (normalized laplacian, node degrees (weighted), node order).
+    '''
+    nodes = sorted(graph.nodes())
+    adjacency = nx.to_scipy_sparse_array(graph, nodelist=nodes, weight=weight, format="csr", dtype=float)
+    degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+    inv_sqrt_degrees = np.divide(1.0, np.sqrt(degrees), out=np.zeros_like(degrees), where=degrees > 0)
+    scaling = sparse.diags_array(inv_sqrt_degrees)
+    identity = sparse.diags_array((degrees > 0).astype(float))
+    laplacian = sparse.csc_array(identity - scaling @ adjacency @ scaling)
+    return (laplacian, degrees, nodes)
+
+def calc_kemeny_constant(graph:nx.Graph, weight="weight", probes=None, rng=None, block_size=256):
+    '''
+    Kemeny constant of a random walk on (connected) graph: the sum of 1 / (1 - lambda) over
+    the non-unit eigenvalues (lambda) of the transition matrix, which is the trace of the
+    pseudo-inverse of the normalized Laplacian (same value as nx.kemeny_constant).
+    Uses a sparse LU factorization of the normalized Laplacian with one node removed
+    (grounded). The trace of its inverse is computed exactly with blocked solves or, if
+    probes is given, estimated from that many random (Rademacher) probe vectors.
+    '''
+    laplacian, degrees, nodes = calc_normalized_laplacian(graph, weight=weight)
+    n = len(nodes)
+    if n < 2:
+        return 0.0
+    # Null space of the laplacian (for a connected graph)
+    null_vector = np.sqrt(degrees / degrees.sum())
+    # With G = inverse of the grounded laplacian (padded with zeros), the pseudo-inverse is
+    # (I - vv')G(I - vv'), so trace(pseudo-inverse) = trace(G) - v'Gv.
+    keep = np.delete(np.arange(n), np.argmax(degrees))
+    lu = splinalg.splu(sparse.csc_array(laplacian[keep][:, keep]))
+    kept_null_vector = null_vector[keep]
+    vGv = kept_null_vector @ lu.solve(kept_null_vector)
+    if probes is None:
+        trace = 0.0
+        for block_start in range(0, n - 1, block_size):
+            block = np.arange(block_start, min(n - 1, block_start + block_size))
+            rhs = np.zeros((n - 1, len(block)))
+            rhs[block, np.arange(len(block))] = 1
+            trace += lu.solve(rhs)[block, np.arange(len(block))].sum()
+    else:
+        rng = np.random.default_rng() if rng is None else rng
+        probe_vectors = rng.choice([-1.0, 1.0], size=(n - 1, probes))
+        trace = np.sum(probe_vectors * lu.solve(probe_vectors)) / probes
+    return float(trace - vGv)
+
+def calc_spectral_summary(graph:nx.Graph, weight="weight"):
+    '''
+    Spectral gap (1 - second largest eigenvalue of the random walk transition matrix, i.e.,
+    smallest nonzero eigenvalue of the normalized Laplacian) and algebraic connectivity
+    (second smallest eigenvalue of the Laplacian). Both are 0 for disconnected graphs.
+    Uses shift-invert eigsh (dense eigenvalues for small graphs).
+    '''
+    normalized_laplacian, degrees, nodes = calc_normalized_laplacian(graph, weight=weight)
+    adjacency = nx.to_scipy_sparse_array(graph, nodelist=nodes, weight=weight, format="csc", dtype=float)
+    laplacian = sparse.csc_array(sparse.diags_array(degrees) - adjacency)
+    summary = {}
+    num_components = csgraph.connected_components(adjacency, directed=False, return_labels=False)
+    for name, matrix in [("spectral_gap", normalized_laplacian), ("algebraic_connectivity", laplacian)]:
+        if len(nodes) < 2 or num_components > 1:
+            summary[name] = 0.0
+        elif len(nodes) < 64:
+            summary[name] = float(np.linalg.eigvalsh(matrix.toarray())[1])
+        else:
+            # Two eigenvalues nearest a (small, negative) shift: 0 and the one we want
+            eigenvalues = splinalg.eigsh(matrix, k=2, sigma=-1e-3, which="LM", return_eigenvectors=False)
+            summary[name] = float(np.sort(eigenvalues)[1])
+        # Clamp numerical noise (e.g., disconnected graphs) to 0
+        summary[name] = summary[name] if summary[name] > 1e-12 else 0.0
+    return summary
+
+# Graph / flow networks used by connectivity worker processes (set by _init_connectivity_worker)
+_connectivity_state = {}
+
+def _init_connectivity_worker(graph:nx.Graph, kind:str):
+    if kind == "node":
+        auxiliary = nx_connectivity.build_auxiliary_node_connectivity(graph)
+        local_fun = nx_connectivity.local_node_connectivity
+    else:
+        auxiliary = nx_connectivity.build_auxiliary_edge_connectivity(graph)
+        local_fun = nx_connectivity.local_edge_connectivity
+    _connectivity_state["graph"] = graph
+    _connectivity_state["local_fun"] = local_fun
+    _connectivity_state["kwargs"] = {
+        "auxiliary": auxiliary,
+        "residual": build_residual_network(auxiliary, "capacity")
+    }
+
+def _min_local_connectivity(pairs, upper_bound, lower_bound):
+    '''
+    Min local (max flow) connectivity over (s, t) pairs. Each flow is cut off at the current
+    minimum; stops early once the minimum reaches lower_bound.
+    '''
+    graph = _connectivity_state["graph"]
+    local_fun = _connectivity_state["local_fun"]
+    K = upper_bound
+    for s, t in pairs:
+        if K <= lower_bound:
+            break
+        K = min(K, local_fun(graph, s, t, cutoff=K, **_connectivity_state["kwargs"]))
+    return K
+
+def _flow_connectivity(graph:nx.Graph, kind:str, pairs:list, upper_bound:int, lower_bound:int, jobs=1):
+    '''
+    Min local connectivity over pairs (bounded by upper / lower bound), optionally spread
+    over jobs worker processes.
+    '''
+    if (not pairs) or upper_bound <= lower_bound:
+        return upper_bound
+    if jobs > 1 and len(pairs) > 1:
+        chunks = [pairs[i::jobs * 4] for i in range(min(len(pairs), jobs * 4))]
+        with multiprocessing.Pool(jobs, initializer=_init_connectivity_worker, initargs=(graph, kind)) as pool:
+            results = pool.starmap(
+                _min_local_connectivity,
+                [(chunk, upper_bound, lower_bound) for chunk in chunks]
+            )
+        return min(results)
+    _init_connectivity_worker(graph, kind)
+    K = _min_local_connectivity(pairs, upper_bound, lower_bound)
+    _connectivity_state.clear()
+    return K
 
-    return expected_births
+def calc_edge_connectivity(graph:nx.Graph, diameter=None, jobs=1):
+    '''
+    Edge connectivity of (undirected) graph. Cheap bounds are checked before running flows:
+    - min degree if min degree >= floor(n / 2) (e.g., well-mixed; checked first)
+    - 0 if disconnected, 1 if graph has a bridge
+    - min degree if diameter <= 2 (diameter, if known)
+    Otherwise, as nx.edge_connectivity: max flows from one node of a dominating set to the
+    others (cut off at the min degree bound), spread over jobs worker processes.
+    '''
+    n = len(graph)
+    if n < 2:
+        return 0
+    min_degree = min(degree for _, degree in graph.degree())
+    if min_degree >= n // 2:
+        return min_degree
+    if not nx.is_connected(graph):
+        return 0
+    if nx.has_bridges(graph):
+        return 1
+    if diameter is not None and diameter <= 2:
+        return min_degree
+    dominating_set = nx.dominating_set(graph)
+    v = dominating_set.pop()
+    pairs = [(v, w) for w in dominating_set]
+    return _flow_connectivity(graph, "edge", pairs, min_degree, 2, jobs=jobs)
+
+def calc_node_connectivity(graph:nx.Graph, edge_connectivity=None, jobs=1):
+    '''
+    Node connectivity of (undirected) graph. Cheap bounds are checked before running flows:
+    - n - 1 if complete (checked first), 0 if disconnected, 1 if graph has an articulation point
+    - node connectivity <= edge connectivity (if known) <= min degree, and
+      node connectivity >= 2 * min degree + 2 - n; done if bounds meet
+    Otherwise, as nx.node_connectivity: max flows between a min degree node and its
+    non-neighbors and between non-adjacent neighbors (each cut off at the current bound),
+    spread over jobs worker processes.
+    '''
+    n = len(graph)
+    if n < 2:
+        return 0
+    v, min_degree = min(graph.degree(), key=lambda pair: pair[1])
+    if min_degree == n - 1:
+        return n - 1
+    if not nx.is_connected(graph):
+        return 0
+    if next(nx.articulation_points(graph), None) is not None:
+        return 1
+    upper_bound = min_degree if edge_connectivity is None else min(min_degree, edge_connectivity)
+    lower_bound = max(2, 2 * min_degree + 2 - n)
+    if lower_bound >= upper_bound:
+        return upper_bound
+    neighbors = set(graph[v])
+    pairs = [(v, w) for w in set(graph) - neighbors - {v}]
+    pairs += [(x, y) for x, y in itertools.combinations(graph[v], 2) if y not in graph[x]]
+    return _flow_connectivity(graph, "node", pairs, upper_bound, lower_bound, jobs=jobs)
+
+def graph_content_hash(graph:nx.Graph):
+    '''
+    Canonical hash of graph content (directedness, node labels, edge set): sha256 of the
+    sorted-index (csr) adjacency matrix, with nodes in a canonical (repr-sorted) order.
+    Does not depend on node / edge insertion order.
+    '''
+    nodes = sorted(graph.nodes(), key=repr)
+    adjacency = nx.to_scipy_sparse_array(graph, nodelist=nodes, weight=None, format="csr", dtype=np.int8)
+    adjacency.sort_indices()
+    content_hash = hashlib.sha256()
+    content_hash.update(json.dumps({"directed": graph.is_directed(), "nodes": [repr(node) for node in nodes]}).encode())
+    content_hash.update(adjacency.indptr.astype(np.int64).tobytes())
+    content_hash.update(adjacency.indices.astype(np.int64).tobytes())
+    content_hash.update(adjacency.data.astype(np.int64).tobytes())
+    return content_hash.hexdigest()
 
+def read_graph_properties(store_dir:str, graph_hash:str):
+    '''
+    All properties stored for graph (graph_hash) in property store directory (store_dir).
+    '''
+    path = os.path.join(store_dir, f"{graph_hash}.json")
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r") as fp:
+        return json.load(fp)
+
+def write_graph_property(store_dir:str, graph_hash:str, name:str, value):
+    '''
+    Persist property (name) for graph (graph_hash) in property store directory (store_dir).
+    Re-reads stored properties before writing (others may have been added concurrently).
+    '''
+    utils.mkdir_p(store_dir)
+    properties = read_graph_properties(store_dir, graph_hash)
+    properties[name] = value
+    path = os.path.join(store_dir, f"{graph_hash}.json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as fp:
+        json.dump(properties, fp, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def cached_graph_property(store_dir, graph_hash:str, name:str, compute_fun):
+    '''
+    Property (name) of graph (graph_hash) from property store directory (store_dir).
+    If not stored, computes it (compute_fun()) and persists it. If store_dir is None,
+    just computes it. Values must be json serializable (numpy scalars are converted).
+    '''
+    if store_dir is None:
+        return compute_fun()
+    properties = read_graph_properties(store_dir, graph_hash)
+    if name in properties:
+        return properties[name]
+    value = compute_fun()
+    if isinstance(value, np.generic):
+        value = value.item()
+    write_graph_property(store_dir, graph_hash, name, value)
+    return value
 
 # import graph_generators as ggen
 # g = ggen.gen_graph_linear_chain(100)
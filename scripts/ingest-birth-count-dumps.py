@@ -0,0 +1,164 @@
+'''
+Collect periodic birth count by location dumps (DumpBirthCountsPerLocation) from a directory
+of avida runs into a single memory-mapped (runs x dump updates x locations) array.
+
+This script generates the following output files:
+- birth_counts_by_update.npy: (runs x updates x locations) int64 array of birth counts.
+  -1 indicates that a run has no birth count for a location at an update (e.g., the run
+  did not reach that update).
+- birth_counts_by_update.json: metadata (updates, and seed / graph for each run).
+
+Load with utilities.load_birth_counts_by_update (the array is memory-mapped, so slices
+can be taken without reading the entire array into memory).
+'''
+
+import argparse
+import functools
+import multiprocessing
+import numpy as np
+import os
+import re
+import utilities as utils
+
+run_identifier = "RUN_"
+
+run_cfg_fields_to_output = {
+    "graph_file",
+    "graph_type",
+    "seed"
+}
+
+def find_birth_count_dumps(run_path, dump_file_regex):
+    '''
+    Find periodic birth count dump files in a run's data directory.
+    Returns {update: file name}
+    '''
+    run_data_path = os.path.join(run_path, "data")
+    dumps = {}
+    for name, is_file, _, _ in utils.scan_dir(run_data_path):
+        match = dump_file_regex.fullmatch(name) if is_file else None
+        if match is not None:
+            dumps[int(match.group(1))] = name
+    return dumps
+
+def scan_run(run_path, dump_file_regex):
+    '''
+    Returns (run info, number of locations, {update: dump file name}) for a run.
+    '''
+    run_cfg_data = utils.read_csv(os.path.join(run_path, "data", "run_params.csv"))
+    run_params = {line["param"]:line["value"] for line in run_cfg_data}
+    run_info = {field:run_params[field] for field in run_cfg_fields_to_output}
+    num_locs = int(run_params["WORLD_X"]) * int(run_params["WORLD_Y"])
+    return (run_info, num_locs, find_birth_count_dumps(run_path, dump_file_regex))
+
+def ingest_run(run_i, run_path, run_dumps, updates, array_path):
+    '''
+    Read all of a run's birth count dumps into its slice of the (memory-mapped) output array.
+    Runs in a worker process when ingesting with multiple jobs.
+    '''
+    birth_counts = np.load(array_path, mmap_mode="r+")
+    update_index = {update:i for i, update in enumerate(updates)}
+    for update in run_dumps:
+        loc_ids, births = utils.read_loc_birth_counts(os.path.join(run_path, "data", run_dumps[update]))
+        birth_counts[run_i, update_index[update], loc_ids] = births
+    birth_counts.flush()
+    del birth_counts
+    return len(run_dumps)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Collect periodic birth count dumps into a (runs x updates x locations) array.")
+    parser.add_argument("--data_dir", type=str, help="Where is the base output directory for each run?")
+    parser.add_argument("--dump_dir", type=str, help="Where to dump this?", default=".")
+    parser.add_argument("--dump_file_pattern", type=str, default="loc_birth_counts_{update}.csv", help="Name of periodic birth count dump files ({update} is replaced with the dump update)")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes to read runs with")
+    parser.add_argument("--search_depth", type=int, default=2, help="How many levels of nested directories (e.g., job-set-N) below data_dir to search for runs")
+    parser.add_argument("--discovery_threads", type=int, default=8, help="Number of threads used to scan directories when discovering runs")
+
+    args = parser.parse_args()
+    data_dir = args.data_dir
+    dump_dir = args.dump_dir
+    num_jobs = args.jobs
+
+    if not os.path.exists(data_dir):
+        print("Unable to find data directory.")
+        exit(-1)
+
+    if "{update}" not in args.dump_file_pattern:
+        print("Dump file pattern must contain {update}")
+        exit(-1)
+
+    if num_jobs < 1:
+        print("Number of jobs must be >= 1")
+        exit(-1)
+
+    dump_file_regex = re.compile(
+        re.escape(args.dump_file_pattern).replace(re.escape("{update}"), r"(\d+)")
+    )
+
+    utils.mkdir_p(dump_dir)
+
+    run_dirs, unfinished_run_dirs = utils.find_run_dirs(
+        data_dir,
+        run_identifier,
+        require_file = os.path.join("data", "run_params.csv"),
+        max_depth = args.search_depth,
+        threads = args.discovery_threads,
+        cache_path = os.path.join(dump_dir, "run_dirs_cache.json")
+    )
+    print(f"Found {len(run_dirs)} run directories ({len(unfinished_run_dirs)} unfinished).")
+    run_paths = [os.path.join(data_dir, run_dir) for run_dir in run_dirs]
+
+    pool = None
+    if num_jobs > 1:
+        pool = multiprocessing.Pool(num_jobs)
+
+    ########################################
+    # Find each run's dump files (determines array shape)
+    ########################################
+    scan_fun = functools.partial(scan_run, dump_file_regex=dump_file_regex)
+    if pool is not None:
+        run_scans = pool.map(scan_fun, run_paths)
+    else:
+        run_scans = [scan_fun(run_path) for run_path in run_paths]
+    updates = sorted({update for _, _, run_dumps in run_scans for update in run_dumps})
+    num_locs = max([num_locs for _, num_locs, _ in run_scans], default=0)
+    print(f"Found {len(updates)} dump updates ({sum(len(run_dumps) for _, _, run_dumps in run_scans)} dump files).")
+
+    ########################################
+    # Fill in array (each run writes its own slice)
+    ########################################
+    array_path = os.path.join(dump_dir, "birth_counts_by_update.npy")
+    birth_counts = np.lib.format.open_memmap(
+        array_path,
+        mode="w+",
+        dtype=np.int64,
+        shape=(len(run_dirs), len(updates), num_locs)
+    )
+    birth_counts[:] = -1
+    birth_counts.flush()
+    del birth_counts
+
+    ingest_args = [
+        (run_i, run_paths[run_i], run_scans[run_i][2], updates, array_path)
+        for run_i in range(len(run_paths))
+    ]
+    if pool is not None:
+        run_results = pool.starmap(ingest_run, ingest_args)
+        pool.close()
+        pool.join()
+    else:
+        run_results = [ingest_run(*run_args) for run_args in ingest_args]
+    for run_i in range(len(run_dirs)):
+        print(f"...({run_i + 1}/{len(run_dirs)}) ingested {run_results[run_i]} dumps from {run_dirs[run_i]}")
+
+    utils.write_birth_counts_by_update_info(
+        os.path.join(dump_dir, "birth_counts_by_update.json"),
+        updates = updates,
+        run_info = [
+            dict(run_scans[run_i][0], run_dir=run_dirs[run_i])
+            for run_i in range(len(run_dirs))
+        ]
+    )
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,17 @@
 '''
-Run moran's i on node_info data.
+Run moran's i (+ Geary's C, Getis-Ord Gi*) on node_info data.
 (generated by summarize-node-properties scripot)
 '''
 
 import argparse
 import os
+import multiprocessing
 import networkx as nx
 import utilities as utils
 import graph_utilities as gutils
 import statistics as stats
-import copy
-import sys
-import pathlib
-
-# Add network_correlation directory to path
-sys.path.append(
-    os.path.join(
-        pathlib.Path(os.path.dirname(os.path.abspath(__file__))).parents[0],
-        "third-party",
-        "network_correlation"
-    )
-)
-import stats as gstats
+import numpy as np
+import spatial_stats as sstats
 
 node_info_fields = [
     "actual_births_mean",
@@ -34,11 +24,18 @@ def main():
     parser.add_argument("--node_info_dir", type=str, help="Data containing summarized node info (produced by summarize-node-properties script)")
     parser.add_argument("--graphs_dir", type=str, help="Path to directory containing relevant graphs")
     parser.add_argument("--dump_dir", type=str, default=".", help="Where to write output files")
+    parser.add_argument("--permutations", type=int, default=100, help="Number of permutations used to compute p-values")
+    parser.add_argument("--seed", type=int, default=None, help="Random number seed (for permutations)")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes to run statistics with")
+    parser.add_argument("--sequential_alpha", type=float, default=None, help="Stop permutation tests early (Besag-Clifford) once p > alpha is certain; --permutations is then the maximum number of permutations")
 
     args = parser.parse_args()
     node_info_dir = args.node_info_dir
     graphs_dir = args.graphs_dir
     dump_dir = args.dump_dir
+    num_permutations = args.permutations
+    num_jobs = args.jobs
+    sequential_alpha = args.sequential_alpha
 
     if not os.path.isdir(node_info_dir):
         print(f"Failed to find node info directory: {node_info_dir}")
@@ -48,17 +45,37 @@ def main():
         print(f"Failed to find graphs directory: {graphs_dir}")
         exit(-1)
 
+    if num_jobs < 1:
+        print("Number of jobs must be >= 1")
+        exit(-1)
+
     utils.mkdir_p(dump_dir)
 
     # Identify node info files
-    node_info_files = [f for f in os.listdir(node_info_dir) if f.startswith("node_info")]
+    node_info_files = sorted([f for f in os.listdir(node_info_dir) if f.startswith("node_info")])
     print(f"Found {len(node_info_files)} node info files.")
 
+    # Each graph gets its own permutation seed (shared by all fields and statistics), so
+    # results do not depend on the number of jobs.
+    root_seed = np.random.SeedSequence(args.seed)
+    print(f"Permutation seed: {root_seed.entropy}")
+    seed_keys = list(node_info_files)
+    permutation_seeds = dict(zip(seed_keys, root_seed.spawn(len(seed_keys))))
+
+    pool = None
+    if num_jobs > 1:
+        pool = multiprocessing.Pool(num_jobs)
+
     # Identify, load all relevant graph files
-    # graphs = {}
-    output_content = []
+    # - Each graph is one job: Moran's I, Geary's C, and Gi* for all fields are computed
+    #   together (from shared permutation draws).
+    # - With multiple jobs, weights are shared with workers.
+    jobs = []
+    job_keys = []
+    graph_nodes = {}
+    shared_blocks = []
+    output_info_by_file = {}
     for node_info_file in node_info_files:
-        output_info = {}
         graph_name = node_info_file.replace("node_info_", "")
         graph_fname = graph_name.replace(".csv", ".mat")
         graph_path = os.path.join(graphs_dir, graph_fname)
@@ -76,24 +93,69 @@ def main():
             for field in node_info_fields:
                 graph.nodes[loc_id][field] = float(node_info[field])
         # Graph is annotated, so we can run statistics.
-        for field in node_info_fields:
-            result = gstats.moran(
-                graph,
-                name = field,
-                alt = "greater",
-                Np = 100,
-                drop_weights = False
-            )
-            moran_i = result[0]
-            moran_p = result[1]
-            output_info[f"{field}_moran_i"] = moran_i
-            output_info[f"{field}_p_val"] = moran_p
-        output_info["graph"] = graph_name
-        output_content.append(output_info)
+        # - Weights are shared by all fields.
+        W, nodes = sstats.weights_matrix(graph, drop_weights = False)
+        field_values = np.column_stack(
+            [sstats.node_values(graph, field, nodes) for field in node_info_fields]
+        )
+        graph_weights = W
+        if pool is not None:
+            blocks, graph_weights = sstats.share_weights(W)
+            shared_blocks.extend(blocks)
+        jobs.append((
+            graph_weights,
+            field_values,
+            permutation_seeds[node_info_file],
+            num_permutations,
+            sequential_alpha
+        ))
+        job_keys.append(node_info_file)
+        graph_nodes[node_info_file] = nodes
+        output_info_by_file[node_info_file] = {"graph": graph_name}
+
+    try:
+        if pool is not None:
+            job_results = pool.starmap(sstats.batch_spatial_stats_job, jobs)
+            pool.close()
+            pool.join()
+        else:
+            job_results = [sstats.batch_spatial_stats_job(*job) for job in jobs]
+    finally:
+        sstats.release_weights(shared_blocks)
+
+    # Global statistics (Moran's I, Geary's C): one line per graph
+    # Local statistics (Gi*): one line per graph location (joins against node info files)
+    gi_star_content = []
+    for node_info_file, results in zip(job_keys, job_results):
+        output_info = output_info_by_file[node_info_file]
+        moran_i, moran_p, moran_permutations = results["moran"]
+        geary_c, geary_p, geary_permutations = results["geary"]
+        gi_star, gi_star_p, gi_star_permutations = results["gi_star"]
+        for field_i, field in enumerate(node_info_fields):
+            output_info[f"{field}_moran_i"] = moran_i[field_i].item()
+            output_info[f"{field}_p_val"] = moran_p[field_i].item()
+            output_info[f"{field}_geary_c"] = geary_c[field_i].item()
+            output_info[f"{field}_geary_p_val"] = geary_p[field_i].item()
+            if sequential_alpha is not None:
+                output_info[f"{field}_permutations"] = moran_permutations[field_i].item()
+                output_info[f"{field}_geary_permutations"] = geary_permutations[field_i].item()
+        for node_i, loc_id in enumerate(graph_nodes[node_info_file]):
+            gi_star_info = {"graph": output_info["graph"], "loc_id": loc_id}
+            for field_i, field in enumerate(node_info_fields):
+                gi_star_info[f"{field}_gi_star"] = gi_star[node_i, field_i].item()
+                gi_star_info[f"{field}_gi_star_p_val"] = gi_star_p[node_i, field_i].item()
+                if sequential_alpha is not None:
+                    gi_star_info[f"{field}_gi_star_permutations"] = gi_star_permutations[node_i, field_i].item()
+            gi_star_content.append(gi_star_info)
+    output_content = list(output_info_by_file.values())
     utils.write_csv(
         os.path.join(dump_dir, "summarized_graphs_morans_i.csv"),
         output_content
     )
+    utils.write_csv(
+        os.path.join(dump_dir, "summarized_graphs_gi_star.csv"),
+        gi_star_content
+    )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
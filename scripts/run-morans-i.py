@@ -1,21 +1,12 @@
 import argparse
 import os
+import multiprocessing
 import networkx as nx
 import utilities as utils
 import graph_utilities as gutils
 import statistics as stats
-import copy
-import sys
-import pathlib
-# Add scripts directory to path, import utilities from scripts directory.
-sys.path.append(
-    os.path.join(
-        pathlib.Path(os.path.dirname(os.path.abspath(__file__))).parents[0],
-        "third-party",
-        "network_correlation"
-    )
-)
-import stats as gstats
+import numpy as np
+import spatial_stats as sstats
 
 
 
@@ -23,21 +14,32 @@ import stats as gstats
 
 # (1) Load annotated birth info
 # (2) Organize by run (seed)
-# (3) For each run:
-#     - Load graph
-#     - Annotate graph with attribute of interest
-#     - Compute statistic on graph
+# (3) For each graph:
+#     - Load graph, build spatial weights (once)
+#     - Collect attribute of interest for each run on that graph (nodes x runs)
+#     - Compute statistic for all runs on graph
 
 def main():
     parser = argparse.ArgumentParser(description="Screen for hotspots")
     parser.add_argument("--graph_loc_data", type=str, help="Summary data file containing graph data by location.")
     parser.add_argument("--graphs_dir", type=str, help="Path to directory containing relevant graphs")
     parser.add_argument("--dump_dir", type=str, default=".", help="Where to write output files")
+    parser.add_argument("--permutations", type=int, default=100, help="Number of permutations used to compute p-values")
+    parser.add_argument("--seed", type=int, default=None, help="Random number seed (for permutations)")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes to run statistics with")
+    parser.add_argument("--sequential_alpha", type=float, default=None, help="Stop permutation tests early (Besag-Clifford) once p > alpha is certain; --permutations is then the maximum number of permutations")
+    parser.add_argument("--local", action="store_true", help="Also compute local Moran's I (hotspots) for every run / location (local_morans_i.csv)")
+    parser.add_argument("--hotspot_alpha", type=float, default=0.05, help="Significance level for labeling local Moran's I hotspots")
 
     args = parser.parse_args()
     graph_loc_data_path = args.graph_loc_data
     graphs_dir = args.graphs_dir
     dump_dir = args.dump_dir
+    num_permutations = args.permutations
+    num_jobs = args.jobs
+    sequential_alpha = args.sequential_alpha
+    run_local = args.local
+    hotspot_alpha = args.hotspot_alpha
 
     if not os.path.isfile(graph_loc_data_path):
         print(f"Failed to find data file: {graph_loc_data_path}")
@@ -47,13 +49,17 @@ def main():
         print(f"Failed to find graphs directory: {graphs_dir}")
         exit(-1)
 
+    if num_jobs < 1:
+        print("Number of jobs must be >= 1")
+        exit(-1)
+
     utils.mkdir_p(dump_dir)
 
     print("Running Moran's i on graphs")
 
     # Load graph_loc data
     graph_loc_data = utils.read_csv(graph_loc_data_path)
-    graph_files = list({line["graph_file"] for line in graph_loc_data})
+    graph_files = sorted({line["graph_file"] for line in graph_loc_data})
     graphs = {}
     for graph_file in graph_files:
         graph_file_path = os.path.join(graphs_dir, graph_file)
@@ -69,58 +75,110 @@ def main():
             data_by_run[run_seed] = []
         data_by_run[run_seed].append(line)
 
-    # For each run, annotate a graph
-    graphs_by_run = {}
+    # Statistic fields: (output prefix, graph_loc_data field)
+    stat_fields = [("task", "task_appearances"), ("birth", "births")]
+
+    # Each (run, statistic field) gets its own permutation seed, so results do not
+    # depend on the number of jobs.
+    root_seed = np.random.SeedSequence(args.seed)
+    print(f"Permutation seed: {root_seed.entropy}")
+    seed_keys = [(run_id, prefix) for run_id in data_by_run for prefix, _ in stat_fields]
+    permutation_seeds = dict(zip(seed_keys, root_seed.spawn(len(seed_keys))))
+    # Local Moran's I uses the same conditional permutation draws for all runs on a
+    # graph, so its seeds are per (graph, statistic field).
+    local_seed_keys = [(graph_file, prefix) for graph_file in graph_files for prefix, _ in stat_fields]
+    local_permutation_seeds = {}
+    if run_local:
+        local_permutation_seeds = dict(zip(local_seed_keys, root_seed.spawn(len(local_seed_keys))))
+
+    pool = None
+    if num_jobs > 1:
+        pool = multiprocessing.Pool(num_jobs)
+
+    # For each graph, build spatial weights once and gather every run's values as
+    # columns of a (nodes x runs) matrix (per statistic field).
+    # - Serially, all runs of a graph are tested in one batched call (per field).
+    # - With multiple jobs, each (run, field) is a job; weights are shared with workers.
+    jobs = []
+    job_keys = []
+    local_jobs = []
+    local_job_keys = []
+    graph_nodes = {}
+    shared_blocks = []
+    for graph_file in graph_files:
+        W, nodes = sstats.weights_matrix(graphs[graph_file], drop_weights = False)
+        graph_nodes[graph_file] = nodes
+        node_index = {node:i for i, node in enumerate(nodes)}
+        graph_runs = [run_id for run_id in data_by_run if graph_files_by_run[run_id] == graph_file]
+        values = {
+            field:np.full((len(nodes), len(graph_runs)), np.nan)
+            for _, field in stat_fields
+        }
+        for run_i, run_id in enumerate(graph_runs):
+            for line in data_by_run[run_id]:
+                loc_id = int(line["loc_id"])
+                if not loc_id in node_index:
+                    print(f"Failed to find loc {loc_id} in {graph_file} for run {run_id}")
+                    continue
+                for _, field in stat_fields:
+                    values[field][node_index[loc_id], run_i] = int(line[field])
+        graph_weights = W
+        runs_per_job = len(graph_runs)
+        if pool is not None:
+            blocks, graph_weights = sstats.share_weights(W)
+            shared_blocks.extend(blocks)
+            runs_per_job = 1
+        for prefix, field in stat_fields:
+            for job_start in range(0, len(graph_runs), runs_per_job):
+                keys = [(run_id, prefix) for run_id in graph_runs[job_start:job_start + runs_per_job]]
+                jobs.append((
+                    graph_weights,
+                    values[field][:, job_start:job_start + runs_per_job],
+                    [permutation_seeds[key] for key in keys],
+                    "greater",
+                    num_permutations,
+                    sequential_alpha
+                ))
+                job_keys.append(keys)
+                if run_local:
+                    local_jobs.append((
+                        graph_weights,
+                        values[field][:, job_start:job_start + runs_per_job],
+                        local_permutation_seeds[(graph_file, prefix)],
+                        "two-sided",
+                        num_permutations
+                    ))
+                    local_job_keys.append(keys)
+
+    # Np: number of permutations
+    # return format: I, p-value, number of permutations used
+    try:
+        if pool is not None:
+            job_results = pool.starmap(sstats.moran_job, jobs)
+            local_job_results = pool.starmap(sstats.local_moran_job, local_jobs)
+            pool.close()
+            pool.join()
+        else:
+            job_results = [sstats.moran_job(*job) for job in jobs]
+            local_job_results = [sstats.local_moran_job(*job) for job in local_jobs]
+    finally:
+        sstats.release_weights(shared_blocks)
+
+    results_by_run = {run_id:{} for run_id in data_by_run}
+    for keys, (moran_i, moran_p, moran_permutations) in zip(job_keys, job_results):
+        for key_i, (run_id, prefix) in enumerate(keys):
+            results_by_run[run_id][prefix] = (
+                moran_i[key_i].item(),
+                moran_p[key_i].item(),
+                moran_permutations[key_i].item()
+            )
+
     output_content = []
-    cnt = 0
     for run_id in data_by_run:
-        print(f"Processing run {cnt+1}/{len(data_by_run)}")
         info = {}
         graph_file = graph_files_by_run[run_id]
-        # Start by making a copy of this type of graph
-        graphs_by_run[run_id] = copy.deepcopy(graphs[graph_file])
-        # Next, annotate using graph data
-        run_data = data_by_run[run_id]
-        for line in run_data:
-            loc_id = int(line["loc_id"])
-            births = line["births"]
-            task_apps = line["task_appearances"]
-            if not loc_id in graphs_by_run[run_id].nodes:
-                print(f"Failed to find loc {loc_id} in {graph_file} for run {run_id}")
-                continue
-            graphs_by_run[run_id].nodes[loc_id]["births"] = int(births)
-            graphs_by_run[run_id].nodes[loc_id]["task_apps"] = int(task_apps)
-        # Graph is annotated, so we can run statistics.
-        task_result = gstats.moran(
-            graphs_by_run[run_id],
-            name = "task_apps",
-            alt = "greater",
-            Np = 100,
-            drop_weights=False
-        )
-        birth_result = gstats.moran(
-            graphs_by_run[run_id],
-            name = "births",
-            alt = "greater",
-            Np = 100,
-            drop_weights=False
-        )
-        # null: data, return_dists:True, drop_weights=True
-        # Np: number of permutations
-        # return format: I, p-value, distances
-
-        # local_task_result = stats.local_moran(
-        #     graphs_by_run[run_id],
-        #     name = "task_apps",
-        #     alt = "greater",
-        #     Np = 100,
-        #     drop_weights=False
-        # )
-
-        task_moran_i = task_result[0]
-        task_p_val = task_result[1]
-        birth_moran_i = birth_result[0]
-        birth_p_val = birth_result[1]
+        task_moran_i, task_p_val, task_permutations = results_by_run[run_id]["task"]
+        birth_moran_i, birth_p_val, birth_permutations = results_by_run[run_id]["birth"]
         print(f"  Run: {run_id} ({graph_file})")
         print(f"    Task Moran's I: {task_moran_i}, p-val: {task_p_val}")
         print(f"    Birth Moran's I: {birth_moran_i}, p-val: {birth_p_val}")
@@ -130,12 +188,38 @@ def main():
         info["task_p_val"] = task_p_val
         info["birth_morans_i"] = birth_moran_i
         info["birth_p_val"] = birth_p_val
+        if sequential_alpha is not None:
+            info["task_permutations"] = task_permutations
+            info["birth_permutations"] = birth_permutations
 
         output_content.append(info)
-        cnt += 1
 
     utils.write_csv(os.path.join(dump_dir, "morans_i.csv"), output_content)
 
+    if not run_local:
+        return
+
+    # Local Moran's I: one line per run per location (loc_id matches node_info files)
+    # - {field}_hotspot gives quadrant (HH, LH, LL, HL) for locations with p <= hotspot_alpha
+    local_results = {}
+    for keys, (local_i, local_p, quadrants) in zip(local_job_keys, local_job_results):
+        for key_i, key in enumerate(keys):
+            local_results[key] = (local_i[:, key_i], local_p[:, key_i], quadrants[:, key_i])
+    local_output_content = []
+    for run_id in data_by_run:
+        graph_file = graph_files_by_run[run_id]
+        for node_i, loc_id in enumerate(graph_nodes[graph_file]):
+            info = {"seed": run_id, "graph_file": graph_file, "loc_id": loc_id}
+            for prefix, _ in stat_fields:
+                local_i, local_p, quadrants = local_results[(run_id, prefix)]
+                quadrant = sstats.quadrant_labels.get(quadrants[node_i].item(), "")
+                info[f"{prefix}_local_i"] = local_i[node_i].item()
+                info[f"{prefix}_local_p_val"] = local_p[node_i].item()
+                info[f"{prefix}_quadrant"] = quadrant
+                info[f"{prefix}_hotspot"] = quadrant if local_p[node_i] <= hotspot_alpha else ""
+            local_output_content.append(info)
+    utils.write_csv(os.path.join(dump_dir, "local_morans_i.csv"), local_output_content)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
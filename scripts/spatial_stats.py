@@ -0,0 +1,495 @@
+'''
+Spatial autocorrelation statistics for values on graph nodes.
+
+Spatial weights are the graph's (sparse) adjacency matrix, row-standardized so that
+each node's weights sum to 1. Weights can be computed once per graph (weights_matrix)
+and reused for any number of value vectors.
+
+Permutation tests evaluate a batch of permutations at once: values are permuted into
+the columns of an (n x batch_size) matrix, and the statistic for every permutation
+is computed with a single sparse matrix product.
+
+To spread tests across processes, weights can be placed in shared memory (share_weights)
+and each job given its own SeedSequence (moran_job). Results do not depend on how
+columns are split into jobs.
+'''
+
+import networkx as nx
+import numpy as np
+import scipy.sparse as sparse
+from multiprocessing import resource_tracker, shared_memory
+
+alternatives = {"greater", "less", "two-sided"}
+
+# Permutations per batch (sequential tests use smaller batches, so they can stop sooner)
+default_batch_size = 1000
+sequential_batch_size = 100
+
+def weights_matrix(graph:nx.Graph, drop_weights=False, row_standardize=True):
+    '''
+    Build (n x n) sparse (csr) spatial weights matrix from graph.
+    Rows / columns are ordered by sorted node id.
+    Returns (weights matrix, node order).
+    '''
+    nodes = sorted(graph.nodes())
+    W = nx.to_scipy_sparse_array(
+        graph,
+        nodelist = nodes,
+        weight = None if drop_weights else "weight",
+        format = "csr",
+        dtype = float
+    )
+    if row_standardize:
+        row_sums = np.asarray(W.sum(axis=1)).ravel()
+        inv_row_sums = np.divide(1.0, row_sums, out=np.zeros_like(row_sums), where=row_sums != 0)
+        W = sparse.csr_array(sparse.diags_array(inv_row_sums) @ W)
+    return (W, nodes)
+
+def node_values(graph:nx.Graph, name:str, nodes:list):
+    '''
+    Array of node attribute (name) values in the given node order.
+    '''
+    return np.array([graph.nodes[node][name] for node in nodes], dtype=float)
+
+def standardize(values):
+    '''
+    Center values (n,) or (n x k) column-wise.
+    '''
+    values = np.asarray(values, dtype=float)
+    return values - values.mean(axis=0)
+
+def morans_i_stat(W, z):
+    '''
+    Moran's I for centered values z (n,) or (n x k; one statistic per column).
+    '''
+    n = W.shape[0]
+    S0 = W.sum()
+    numerator = np.sum(z * (W @ z), axis=0)
+    denominator = np.sum(z * z, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (n / S0) * numerator / denominator
+
+def permutation_p_value(observed, permuted, alt):
+    '''
+    p-value of observed statistic(s) (k,) given permuted statistics (k x Np).
+    Also works for any number of leading dimensions (e.g., (n x k) and (n x k x Np)).
+    '''
+    return count_p_value(
+        observed,
+        np.sum(permuted >= observed[..., None], axis=-1),
+        np.sum(permuted <= observed[..., None], axis=-1),
+        permuted.shape[-1],
+        alt
+    )
+
+def count_p_value(observed, num_greater_equal, num_less_equal, Np, alt):
+    '''
+    p-value(s) from the number of permuted statistics >= / <= observed statistic(s).
+    '''
+    if alt == "greater":
+        extreme = num_greater_equal
+    elif alt == "less":
+        extreme = num_less_equal
+    else:
+        # two-sided: twice the smaller tail
+        extreme = np.minimum(num_greater_equal, num_less_equal)
+    p = (extreme + 1) / (Np + 1)
+    if alt == "two-sided":
+        p = np.minimum(2 * p, 1.0)
+    return np.where(np.isnan(observed), np.nan, p)
+
+def sequential_threshold(alpha, Np, alt):
+    '''
+    Besag-Clifford stopping threshold (h) for a sequential permutation test: once h
+    permuted statistics are at least as extreme as the observed statistic, the p-value
+    over all Np permutations is certain to be > alpha.
+    '''
+    return max(1, int(np.floor(alpha * (Np + 1) / (2 if alt == "two-sided" else 1))))
+
+def count_extremes(observed, permuted, num_greater_equal, num_less_equal, stopped_at, num_done, alt, h=None):
+    '''
+    Add a batch of permuted statistics (... x batch) to running counts (in place) of
+    permuted statistics >= / <= observed statistics (...).
+    If h is given, statistics whose extreme count reaches h are stopped (Besag-Clifford):
+    stopped_at records the number of permutations used, and their counts stop changing.
+    '''
+    active = stopped_at == 0
+    greater_equal = np.cumsum(permuted >= observed[..., None], axis=-1) + num_greater_equal[..., None]
+    less_equal = np.cumsum(permuted <= observed[..., None], axis=-1) + num_less_equal[..., None]
+    last = np.full(observed.shape, permuted.shape[-1] - 1)
+    if h is not None:
+        if alt == "greater":
+            extreme = greater_equal
+        elif alt == "less":
+            extreme = less_equal
+        else:
+            extreme = np.minimum(greater_equal, less_equal)
+        hit = extreme >= h
+        stopping = active & hit.any(axis=-1)
+        last = np.where(stopping, np.argmax(hit, axis=-1), last)
+        stopped_at[stopping] = num_done + last[stopping] + 1
+    num_greater_equal[active] = np.take_along_axis(greater_equal, last[..., None], axis=-1)[..., 0][active]
+    num_less_equal[active] = np.take_along_axis(less_equal, last[..., None], axis=-1)[..., 0][active]
+
+def sequential_p_value(observed, num_greater_equal, num_less_equal, stopped_at, Np, alt, h=None):
+    '''
+    p-value(s) for a (possibly) sequential permutation test (see count_extremes).
+    Stopped statistics get the Besag-Clifford p-value h / permutations used.
+    Returns (p-values, number of permutations used).
+    '''
+    p = count_p_value(observed, num_greater_equal, num_less_equal, Np, alt)
+    num_permutations = np.where(stopped_at > 0, stopped_at, Np)
+    if h is not None:
+        stopped_p = h / np.maximum(stopped_at, 1)
+        if alt == "two-sided":
+            stopped_p = np.minimum(2 * stopped_p, 1.0)
+        p = np.where(stopped_at > 0, stopped_p, p)
+    return (p, num_permutations)
+
+def permutation_test(W, values, stat, alt="greater", Np=100, rng=None, batch_size=None, return_dists=False, alpha=None, return_num_permutations=False, max_block_bytes=2**24):
+    '''
+    Permutation test for a statistic computed by stat(W, z) on centered values z.
+    values can be a single vector (n,) or many (n x k; each column tested separately).
+    rng can be a single generator or a list of generators (one per column; a column's
+    results then do not depend on the other columns).
+    Each batch permutes every (untested) column with its own generator and stacks the
+    permutations into one (n x columns * batch_size) matrix (split into blocks of at most
+    max_block_bytes), so a batch costs one sparse product for all columns.
+    If alpha is given, the test is sequential (Besag-Clifford): permutations are drawn in
+    batches only until p > alpha is certain (see sequential_threshold), up to Np.
+    Returns (observed statistic(s), p-value(s), permutation distribution(s) if return_dists
+    (nan for permutations not drawn), number of permutations used if return_num_permutations).
+    '''
+    if alt not in alternatives:
+        raise ValueError(f"Unknown alternative: {alt}")
+    if batch_size is None:
+        batch_size = default_batch_size if alpha is None else sequential_batch_size
+    h = None if alpha is None else sequential_threshold(alpha, Np, alt)
+    values = np.asarray(values, dtype=float)
+    single = values.ndim == 1
+    values = values.reshape(values.shape[0], -1)
+    num_vars = values.shape[1]
+    if isinstance(rng, (list, tuple)):
+        rngs = rng
+    else:
+        rngs = [np.random.default_rng() if rng is None else rng] * num_vars
+    # Each variable is centered on its own (as a contiguous column), so results do not
+    # depend on which other variables are tested in the same call.
+    centered = [standardize(np.ascontiguousarray(values[:, var_i]))[:, None] for var_i in range(num_vars)]
+    observed = np.array([stat(W, z)[0] for z in centered], dtype=float).reshape(num_vars)
+    num_greater_equal = np.zeros(num_vars, dtype=np.int64)
+    num_less_equal = np.zeros(num_vars, dtype=np.int64)
+    stopped_at = np.zeros(num_vars, dtype=np.int64)
+    permuted = np.full((num_vars, Np), np.nan) if return_dists else None
+    vars_per_block = max(1, max_block_bytes // (8 * values.shape[0] * batch_size))
+    for batch_start in range(0, Np, batch_size):
+        batch = min(batch_size, Np - batch_start)
+        active = np.flatnonzero(stopped_at == 0)
+        for block_start in range(0, len(active), vars_per_block):
+            block = active[block_start:block_start + vars_per_block]
+            # Each variable's permutations are drawn from its own generator, and the
+            # permutations of all variables in the block go through one stat(W, z) call
+            # (numpy sums a single column pairwise, wider matrices row by row, so pad to at
+            # least 2 columns to keep each statistic independent of the block width)
+            z_perm = np.empty((values.shape[0], max(2, len(block) * batch)))
+            for block_i, var_i in enumerate(block):
+                columns = z_perm[:, block_i * batch:(block_i + 1) * batch]
+                columns[:] = centered[var_i]
+                rngs[var_i].permuted(columns, axis=0, out=columns)
+            if z_perm.shape[1] > len(block) * batch:
+                z_perm[:, 1:] = z_perm[:, :1]
+            batch_stats = stat(W, z_perm)[:len(block) * batch].reshape(len(block), batch)
+            if return_dists:
+                permuted[block, batch_start:batch_start + batch] = batch_stats
+            counts = (num_greater_equal[block], num_less_equal[block], stopped_at[block])
+            count_extremes(observed[block], batch_stats, *counts, batch_start, alt, h)
+            num_greater_equal[block], num_less_equal[block], stopped_at[block] = counts
+    p, num_permutations = sequential_p_value(observed, num_greater_equal, num_less_equal, stopped_at, Np, alt, h)
+    if single:
+        observed, p, num_permutations = observed[0].item(), p[0].item(), num_permutations[0].item()
+        permuted = None if permuted is None else permuted[0]
+    result = (observed, p)
+    if return_dists:
+        result += (permuted,)
+    if return_num_permutations:
+        result += (num_permutations,)
+    return result
+
+def moran(W, values, alt="greater", Np=100, rng=None, batch_size=None, return_dists=False, alpha=None, return_num_permutations=False, max_block_bytes=2**24):
+    '''
+    Moran's I with permutation test (see permutation_test).
+    '''
+    return permutation_test(W, values, morans_i_stat, alt, Np, rng, batch_size, return_dists, alpha, return_num_permutations, max_block_bytes)
+
+def graph_moran(graph:nx.Graph, name:str, alt="greater", Np=100, drop_weights=False, rng=None, alpha=None):
+    '''
+    Moran's I for node attribute (name) on graph.
+    Returns (I, p-value).
+    '''
+    W, nodes = weights_matrix(graph, drop_weights=drop_weights)
+    return moran(W, node_values(graph, name, nodes), alt=alt, Np=Np, rng=rng, alpha=alpha)
+
+# Default alternatives for batch_spatial_stats. Positive spatial autocorrelation gives
+# large Moran's I, small Geary's C; Gi* hot (cold) spots are large (small) Gi*.
+batch_stat_alternatives = {"moran": "greater", "geary": "less", "gi_star": "two-sided"}
+
+def gi_star_weights(W):
+    '''
+    Getis-Ord Gi* weights derived from W: each node is added to its own neighborhood (with
+    weight equal to its largest neighbor weight; 1 for isolated nodes), and rows are
+    re-standardized. Returns (self weights (n,), row scales (n,)) such that
+    W* @ x = scales * (W @ x + self weights * x).
+    '''
+    W = sparse.csr_array(W)
+    cardinality = np.diff(W.indptr)
+    self_weights = np.ones(W.shape[0])
+    has_neighbors = cardinality > 0
+    self_weights[has_neighbors] = np.maximum.reduceat(W.data, W.indptr[:-1][has_neighbors])
+    scales = 1.0 / (np.asarray(W.sum(axis=1)).ravel() + self_weights)
+    return (self_weights, scales)
+
+def batch_spatial_stats(W, values, Np=100, rng=None, batch_size=None, alts=None, alpha=None):
+    '''
+    Global Moran's I, global Geary's C, and local Getis-Ord Gi* (as z-scores) for each
+    column of values (n,) or (n x k), with permutation p-values.
+    Every statistic is computed from W @ z, so each batch of permutations costs one sparse
+    product for all columns and statistics. All columns share the same permutation draws.
+    alts overrides batch_stat_alternatives (e.g., {"gi_star": "greater"}).
+    If alpha is given, each statistic's test is sequential (see permutation_test); draws
+    continue until every statistic is decided (or Np permutations are drawn).
+    Returns {"moran": (I, p, permutations used), "geary": (C, p, permutations used),
+    "gi_star": (Gi* (n,) or (n x k), p, permutations used)}.
+    '''
+    alts = dict(batch_stat_alternatives, **({} if alts is None else alts))
+    for alt in alts.values():
+        if alt not in alternatives:
+            raise ValueError(f"Unknown alternative: {alt}")
+    rng = np.random.default_rng() if rng is None else rng
+    if batch_size is None:
+        batch_size = default_batch_size if alpha is None else sequential_batch_size
+    values = np.asarray(values, dtype=float)
+    single = values.ndim == 1
+    z = standardize(values.reshape(values.shape[0], -1))
+    n, num_vars = z.shape
+    W = sparse.csr_array(W)
+    S0 = W.sum()
+    # Geary's C numerator: sum_ij w_ij (z_i - z_j)^2 = sum_i (row_i + col_i) z_i^2 - 2 z'Wz
+    geary_weights = (np.asarray(W.sum(axis=1)).ravel() + np.asarray(W.sum(axis=0)).ravel())[:, None]
+    self_weights, scales = gi_star_weights(W)
+    # Gi* variance term (rows of W* sum to 1): (n * sum_j w*_ij^2 - 1) / (n - 1)
+    gi_star_S1 = scales ** 2 * (np.asarray(W.multiply(W).sum(axis=1)).ravel() + self_weights ** 2)
+    gi_star_scale = np.sqrt((n * gi_star_S1 - 1) / (n - 1))[:, None]
+
+    def compute(z, lag):
+        zz = np.sum(z * z, axis=0)
+        zlag = np.sum(z * lag, axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            moran = (n / S0) * zlag / zz
+            geary = (n - 1) * (np.sum(geary_weights * z * z, axis=0) - 2 * zlag) / (2 * S0 * zz)
+            gi_star = scales[:, None] * (lag + self_weights[:, None] * z) / (np.sqrt(zz / n) * gi_star_scale)
+        return (moran, geary, gi_star)
+
+    observed = dict(zip(["moran", "geary", "gi_star"], compute(z, W @ z)))
+    h = {stat:(None if alpha is None else sequential_threshold(alpha, Np, alts[stat])) for stat in observed}
+    # Running counts: [>= observed, <= observed, stopped at]
+    counts = {
+        stat:[np.zeros(observed[stat].shape, dtype=np.int64) for _ in range(3)]
+        for stat in observed
+    }
+    for batch_start in range(0, Np, batch_size):
+        if all(np.all(counts[stat][2] > 0) for stat in observed):
+            break
+        batch = min(batch_size, Np - batch_start)
+        # One permutation of node indices per column (shared by all variables)
+        perm = rng.permuted(np.repeat(np.arange(n)[:, None], batch, axis=1), axis=0)
+        # (n x (batch * num_vars)): columns ordered by permutation, then variable
+        z_perm = z[perm].reshape(n, batch * num_vars)
+        moran, geary, gi_star = compute(z_perm, W @ z_perm)
+        permuted = {
+            "moran": moran.reshape(batch, num_vars).T,
+            "geary": geary.reshape(batch, num_vars).T,
+            "gi_star": np.moveaxis(gi_star.reshape(n, batch, num_vars), 1, -1)
+        }
+        for stat in observed:
+            count_extremes(observed[stat], permuted[stat], *counts[stat], batch_start, alts[stat], h[stat])
+
+    results = {}
+    for stat in observed:
+        p, num_permutations = sequential_p_value(observed[stat], *counts[stat], Np, alts[stat], h[stat])
+        results[stat] = (observed[stat], p, num_permutations)
+    if single:
+        results = {stat:tuple(result[..., 0] for result in results[stat]) for stat in results}
+        for stat in ["moran", "geary"]:
+            results[stat] = tuple(result.item() for result in results[stat])
+    return results
+
+# Local Moran's I quadrants (value high/low, neighbors high/low)
+quadrant_labels = {1: "HH", 2: "LH", 3: "LL", 4: "HL"}
+
+def local_moran(W, values, alt="two-sided", Np=99, rng=None, max_block_bytes=2**26):
+    '''
+    Local Moran's I (LISA) for every node with conditional permutation p-values.
+    values can be a single vector (n,) or many (n x k; e.g., one column per run).
+    For node i, I_i = z_i * (Wz)_i / m2 (m2 = sum(z^2) / n). Conditional permutations hold
+    z_i (and any self weight w_ii) fixed and draw i's other neighbor values at random from
+    the other n-1 nodes (a node with n-1 neighbors gets a random ordering of them; if they
+    are equally weighted, its p-value is 1 and it is not permuted). The same Np random
+    draws are used for every node and column (so results for a column do not depend on
+    which other columns are tested in the same call). Nodes are permuted in groups of
+    equal degree, so each node only costs its own number of neighbors per draw.
+    Returns (I (n,) or (n x k), p-values, quadrants (1=HH, 2=LH, 3=LL, 4=HL; 0 if z_i or lag is 0)).
+    '''
+    if alt not in alternatives:
+        raise ValueError(f"Unknown alternative: {alt}")
+    rng = np.random.default_rng() if rng is None else rng
+    values = np.asarray(values, dtype=float)
+    single = values.ndim == 1
+    values = values.reshape(values.shape[0], -1)
+    n, num_vars = values.shape
+    W = sparse.csr_array(W)
+    columns = [standardize(np.ascontiguousarray(values[:, var_i])) for var_i in range(num_vars)]
+    z = np.column_stack(columns)
+    m2 = np.array([np.dot(column, column) / n for column in columns])
+    lag = W @ z
+    with np.errstate(divide="ignore", invalid="ignore"):
+        observed = z * lag / m2
+    quadrants = np.select(
+        [(z > 0) & (lag > 0), (z < 0) & (lag > 0), (z < 0) & (lag < 0), (z > 0) & (lag < 0)],
+        [1, 2, 3, 4],
+        default = 0
+    )
+
+    # Self weights (self-loops) stay with node i; only other neighbors are permuted.
+    self_weights = W.diagonal()
+    W_neighbors = W.copy()
+    W_neighbors.setdiag(0)
+    W_neighbors.eliminate_zeros()
+    cardinality = np.diff(W_neighbors.indptr)
+    rows = np.repeat(np.arange(n), cardinality)
+    # Nodes with all n-1 other nodes as equally weighted neighbors have the same lag under
+    # every permutation (p = 1), so they are not permuted at all.
+    has_neighbors = cardinality > 0
+    starts = W_neighbors.indptr[:-1][has_neighbors]
+    equal_weights = np.ones(n, dtype=bool)
+    equal_weights[has_neighbors] = np.maximum.reduceat(W_neighbors.data, starts) == np.minimum.reduceat(W_neighbors.data, starts)
+    degenerate = (cardinality == n - 1) & equal_weights
+    permuted_nodes = np.flatnonzero(~degenerate)
+    # Neighbor weights of permuted nodes, padded to their max number of neighbors
+    # (n x max_neighbors; without self weights, a node has at most n-1 neighbors)
+    max_neighbors = int(cardinality[permuted_nodes].max(initial=0))
+    neighbor_weights = np.zeros((n, max_neighbors))
+    keep = ~degenerate[rows]
+    neighbor_weights[
+        rows[keep],
+        (np.arange(W_neighbors.nnz) - np.repeat(W_neighbors.indptr[:-1], cardinality))[keep]
+    ] = W_neighbors.data[keep]
+    # Np draws of max_neighbors distinct nodes from n-1 (node i itself is skipped by
+    # shifting draws >= i up by one).
+    draws = np.array(
+        [rng.choice(max(n - 1, 0), size=max_neighbors, replace=False) for _ in range(Np)],
+        dtype=np.int64
+    ).reshape(Np, max_neighbors)
+
+    p = np.where(np.isnan(observed), np.nan, 1.0)
+    chunk_size = max(1, max_block_bytes // (8 * max(1, Np * num_vars)))
+    # Nodes are grouped by number of neighbors, so each chunk only sums over its own
+    # neighbors (a single hub does not pad every other node to its degree).
+    permuted_nodes = permuted_nodes[np.argsort(cardinality[permuted_nodes], kind="stable")]
+    group_starts = np.flatnonzero(np.diff(cardinality[permuted_nodes], prepend=-1))
+    group_ends = np.append(group_starts[1:], len(permuted_nodes))
+    for group_start, group_end in zip(group_starts, group_ends):
+        num_neighbors = cardinality[permuted_nodes[group_start]]
+        for chunk_start in range(group_start, group_end, chunk_size):
+            chunk_nodes = permuted_nodes[chunk_start:min(group_end, chunk_start + chunk_size)]
+            permuted_lag = np.broadcast_to(
+                self_weights[chunk_nodes, None, None] * z[chunk_nodes, None, :],
+                (len(chunk_nodes), Np, num_vars)
+            ).copy()
+            for neighbor_i in range(num_neighbors):
+                idx = draws[None, :, neighbor_i] + (draws[None, :, neighbor_i] >= chunk_nodes[:, None])
+                permuted_lag += neighbor_weights[chunk_nodes, neighbor_i, None, None] * z[idx]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                permuted = z[chunk_nodes, None, :] * permuted_lag / m2
+            p[chunk_nodes] = permutation_p_value(observed[chunk_nodes], np.moveaxis(permuted, 1, -1), alt)
+    if single:
+        observed, p, quadrants = observed[:, 0], p[:, 0], quadrants[:, 0]
+    return (observed, p, quadrants)
+
+def share_weights(W):
+    '''
+    Copy (csr) weights matrix into shared memory.
+    Returns (shared memory blocks, descriptor). The descriptor can be sent to worker
+    processes (see attach_weights); caller should release_weights(blocks) when done.
+    '''
+    blocks = []
+    descriptor = {"shape": W.shape, "arrays": {}}
+    for name in ["data", "indices", "indptr"]:
+        array = getattr(W, name)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+        blocks.append(block)
+        descriptor["arrays"][name] = (block.name, array.shape, array.dtype.str)
+    return (blocks, descriptor)
+
+def release_weights(blocks):
+    '''
+    Close and unlink shared memory blocks created by share_weights.
+    '''
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+# Weights attached (in this process) from shared memory: {block name: (W, blocks)}
+_attached_weights = {}
+
+def attach_weights(descriptor):
+    '''
+    (csr) weights matrix backed by shared memory described by descriptor (see share_weights).
+    Attached weights are cached, so each process attaches to a given matrix once.
+    '''
+    key = descriptor["arrays"]["data"][0]
+    if key not in _attached_weights:
+        blocks = []
+        arrays = {}
+        for name, (block_name, shape, dtype) in descriptor["arrays"].items():
+            block = shared_memory.SharedMemory(name=block_name)
+            # Creating process owns (and unlinks) the block; don't track it here too.
+            resource_tracker.unregister(block._name, "shared_memory")
+            blocks.append(block)
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        W = sparse.csr_array(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape = descriptor["shape"]
+        )
+        _attached_weights[key] = (W, blocks)
+    return _attached_weights[key][0]
+
+def moran_job(weights, values, seeds, alt="greater", Np=100, alpha=None):
+    '''
+    Moran's I job (e.g., for a worker process).
+    weights is a weights matrix or a shared weights descriptor (see share_weights).
+    seeds gives one SeedSequence per column of values (n x k).
+    Returns (I values (k,), p-values (k,), permutations used (k,)).
+    '''
+    W = attach_weights(weights) if isinstance(weights, dict) else weights
+    rngs = [np.random.default_rng(seed) for seed in seeds]
+    return moran(W, values, alt=alt, Np=Np, rng=rngs, alpha=alpha, return_num_permutations=True)
+
+def local_moran_job(weights, values, seed, alt="two-sided", Np=99):
+    '''
+    Local Moran's I job (e.g., for a worker process).
+    weights is a weights matrix or a shared weights descriptor (see share_weights).
+    seed (SeedSequence) determines the conditional permutation draws.
+    Returns (I (n x k), p-values (n x k), quadrants (n x k)).
+    '''
+    W = attach_weights(weights) if isinstance(weights, dict) else weights
+    return local_moran(W, values, alt=alt, Np=Np, rng=np.random.default_rng(seed))
+
+def batch_spatial_stats_job(weights, values, seed, Np=100, alpha=None):
+    '''
+    batch_spatial_stats job (e.g., for a worker process).
+    weights is a weights matrix or a shared weights descriptor (see share_weights).
+    seed (SeedSequence) determines the (shared) permutation draws.
+    '''
+    W = attach_weights(weights) if isinstance(weights, dict) else weights
+    return batch_spatial_stats(W, values, Np=Np, rng=np.random.default_rng(seed), alpha=alpha)
@@ -7,8 +7,10 @@ The summary file is generated by first running the aggregate.csv script.
 import argparse
 import os
 import networkx as nx
+import numpy as np
 import utilities as utils
 import graph_utilities as gutils
+import graph_centrality as gcent
 import graph_generators as ggens
 import matplotlib.pyplot as plt
 import statistics as stats
@@ -36,8 +38,12 @@ def task_name(in_name):
     else:
         return in_name
 
-def calc_graph_summary_properties(graph):
+def calc_graph_summary_properties(graph, jobs=1, property_store=None):
     properties = {}
+    # Expensive properties are cached in property store (if given), keyed by graph content
+    graph_hash = gutils.graph_content_hash(graph) if property_store is not None else None
+    def cached(name, compute_fun):
+        return gutils.cached_graph_property(property_store, graph_hash, name, compute_fun)
     # Check connectivity
     is_connected = nx.is_connected(graph)
     print("  analyzing graph summary properties")
@@ -49,28 +55,36 @@ def calc_graph_summary_properties(graph):
     properties["degree_median"] = stats.median(node_degrees)
     properties["degree_variance"] = stats.variance(node_degrees)
     print("  degree done")
-    properties["girth"] = nx.girth(graph)
-    properties["degree_assortivity_coef"] = nx.degree_assortativity_coefficient(graph)
-    properties["num_bridges"] = len(list(nx.bridges(graph)))
+    properties["girth"] = cached("girth", lambda: nx.girth(graph))
+    properties["degree_assortivity_coef"] = cached("degree_assortivity_coef", lambda: nx.degree_assortativity_coefficient(graph))
+    properties["num_bridges"] = cached("num_bridges", lambda: len(list(nx.bridges(graph))))
     # properties["max_clique_size"] = len(nx.make_max_clique_graph(graph).nodes)
-    properties["transitivity"] = nx.transitivity(graph)
+    properties["transitivity"] = cached("transitivity", lambda: nx.transitivity(graph))
     print("  transitivity done")
     # properties["avg_clustering"] = nx.average_clustering(graph)
-    properties["num_connected_components"] = nx.number_connected_components(graph)
+    properties["num_connected_components"] = cached("num_connected_components", lambda: nx.number_connected_components(graph))
     # properties["num_articulation_points"] = len(list(nx.articulation_points(graph)))
     # properties["avg_node_connectivity"] = nx.average_node_connectivity(graph)
-    properties["edge_connectivity"] = nx.edge_connectivity(graph)
-    properties["node_connectivity"] = nx.node_connectivity(graph)
+    # Diameter, radius, and longest shortest path all come from one (sparse BFS) eccentricity pass
+    distance_properties = cached("distance_properties", lambda: gutils.calc_distance_properties(graph, jobs=jobs))
+    # Connectivity: cheap bounds first (diameter bounds edge connectivity, which bounds node connectivity)
+    properties["edge_connectivity"] = cached(
+        "edge_connectivity",
+        lambda: gutils.calc_edge_connectivity(graph, diameter=distance_properties["diameter"], jobs=jobs)
+    )
+    properties["node_connectivity"] = cached(
+        "node_connectivity",
+        lambda: gutils.calc_node_connectivity(graph, edge_connectivity=properties["edge_connectivity"], jobs=jobs)
+    )
     print("  connectivity done")
-    properties["diameter"] = nx.diameter(graph) if is_connected else "error"
-    properties["radius"] = nx.radius(graph) if is_connected else "error"
-    properties["kemeny_constant"] = nx.kemeny_constant(graph) if is_connected else "error"
-    print("  kemeny constant done")
+    properties["diameter"] = distance_properties["diameter"] if is_connected else "error"
+    properties["radius"] = distance_properties["radius"] if is_connected else "error"
+    properties["kemeny_constant"] = cached("kemeny_constant", lambda: gutils.calc_kemeny_constant(graph)) if is_connected else "error"
+    properties.update(cached("spectral_summary", lambda: gutils.calc_spectral_summary(graph)))
+    print("  kemeny constant / spectral summary done")
     # properties["global_efficiency"] = nx.global_efficiency(graph)
     # properties["wiener_index"] = nx.wiener_index(graph)
-    length_results = nx.all_pairs_shortest_path_length(graph)
-    max_short_path = max([max(focal_node[1].values()) for focal_node in length_results])
-    properties["longest_shortest_path"] = max_short_path
+    properties["longest_shortest_path"] = distance_properties["longest_shortest_path"]
     print("  done analyzing graph summary properties")
     # properties["connectivity"] = nx.all_pairs_node_connectivity(graph)
 
@@ -79,9 +93,12 @@ def calc_graph_summary_properties(graph):
 def main():
     parser = argparse.ArgumentParser(description="Screen for hotspots")
     parser.add_argument("--summary_data", type=str, help="Summary data file that contains task appearance data.")
-    parser.add_argument("--graph_birth_data", type=str, help="Summary data file containing graph birth location data.")
+    parser.add_argument("--graph_birth_data", type=str, help="Summary data file containing graph birth location data (.csv or births matrix .npz).")
     parser.add_argument("--graphs_dir", type=str, help="Path to directory containing relevant graphs")
     parser.add_argument("--dump_dir", type=str, default=".", help="Where to write output files")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes used for reading graph files and graph distance / connectivity / centrality calculations")
+    parser.add_argument("--property_store", type=str, default=None, help="Directory used to cache graph properties (keyed by graph content) across runs")
+    parser.add_argument("--target_update", type=int, default=None, help="Which summary update (target_update) to use if summary has rows for multiple updates (defaults to each run's final update)")
 
     args = parser.parse_args()
     summary_data_path = args.summary_data
@@ -101,6 +118,11 @@ def main():
 
     # Read over summary file
     summary_data = utils.read_csv(summary_data_path)
+    # Summary may have one row per run per summary update; keep one row per run
+    summary_data = utils.filter_summary_target_update(summary_data, args.target_update)
+    if len(summary_data) == 0:
+        print(f"No summary data for target update: {args.target_update}")
+        exit(-1)
     # NOTE - assumes all runs in summary have same world size
     world_x = int(summary_data[-1]["WORLD_X"])
     world_y = int(summary_data[-1]["WORLD_Y"])
@@ -130,81 +152,54 @@ def main():
     graph_files = list(data_by_graph.keys())
     graph_files.sort()
 
-    # Distributions of task locations by task
-    graph_task_loc_info = {
-        graph: { task:[] for task in tasks }
-        for graph in graph_files
-    }
-
-    graph_tasks_agg_loc_info = {
-        graph: []
-        for graph in graph_files
-    }
-
-    graph_tasks_appearances = {
-        graph: { task: 0 for task in tasks }
-        for graph in graph_files
-    }
-
-    graph_total_tasks = {
-        graph: 0
-        for graph in graph_files
-    }
-
-    # For each graph, get all first location appearances
-    for graph in graph_task_loc_info:
-        for line in data_by_graph[graph]:
-            for task in tasks:
-                tname = task_name(task)
-                task_completed = (line[f"task_loc_{tname}_completed"] == "1") and not ((line[f"task_loc_{tname}_loc_id"] == "-1"))
-                if not task_completed:
-                    continue
-                # task_loc_x = line[f"task_loc_{task}_loc_x"]
-                # task_loc_y = line[f"task_loc_{task}_loc_y"]
-                task_loc_id = int(line[f"task_loc_{tname}_loc_id"])
-                graph_tasks_agg_loc_info[graph].append(task_loc_id)
-                graph_task_loc_info[graph][task].append(task_loc_id)
-                graph_tasks_appearances[graph][task] += 1
-                graph_total_tasks[graph] += 1
-
-
     ############################################################################
-    # Add task appearances by location
+    # Count task appearances by location
+    # - (runs x tasks) array of first appearance locations (-1 if task not completed)
     ############################################################################
-    task_location_info = {}
-    for graph in graph_task_loc_info:
-        task_location_info[graph] = {}
-        # Add per-task appearances to location information
-        for task in tasks:
-            task_locs = graph_task_loc_info[graph][task]
-            for loc in task_locs:
-                if not loc in task_location_info[graph]:
-                    task_location_info[graph][loc] = {task:{"count":0,"prop":0} for task in tasks}
-                    task_location_info[graph][loc]["all"] = {"count":0, "prop":0}
-                task_location_info[graph][loc][task]["count"] += 1
-                task_location_info[graph][loc]["all"]["count"] += 1
-
-        # Calculate proportions (per task and aggregated)
-        for loc in task_location_info[graph]:
-            for task in tasks:
-                if graph_tasks_appearances[graph][task] > 0:
-                    task_location_info[graph][loc][task]["prop"] = task_location_info[graph][loc][task]["count"] / graph_tasks_appearances[graph][task]
-            if graph_total_tasks[graph] > 0:
-                task_location_info[graph][loc]["all"]["prop"] = task_location_info[graph][loc]["all"]["count"] / graph_total_tasks[graph]
+    run_graphs = np.array([graph for graph in graph_files for line in data_by_graph[graph]])
+    task_locs = utils.read_first_task_locs(
+        [line for graph in graph_files for line in data_by_graph[graph]],
+        [task_name(task) for task in tasks]
+    )
+    task_location_info = {} # {graph: {"count": (tasks x locs), "prop": (tasks x locs), "all_count": (locs), "all_prop": (locs)}}
+    for graph in graph_files:
+        # Per-task appearances by location (tasks x locs)
+        task_counts = utils.count_locs(task_locs[run_graphs == graph].T, world_size)
+        task_totals = task_counts.sum(axis=1, keepdims=True)
+        all_counts = task_counts.sum(axis=0)
+        all_total = all_counts.sum()
+        task_location_info[graph] = {
+            "count": task_counts,
+            "prop": np.divide(task_counts, task_totals, out=np.zeros(task_counts.shape), where=task_totals > 0),
+            "all_count": all_counts,
+            "all_prop": all_counts / all_total if all_total > 0 else np.zeros(world_size)
+        }
 
     ############################################################################
     # For each graph, get birth counts by location
     ############################################################################
-    birth_loc_data = utils.read_csv(birth_locs_data_path)
     actual_birth_locs = {} # {graph: {loc: [birth counts]}}
-    for line in birth_loc_data:
-        line_graph = line["graph_file"]
-        if not line_graph in actual_birth_locs:
-            actual_birth_locs[line_graph] = {}
-        loc = int(line["loc_id"])
-        if not loc in actual_birth_locs[line_graph]:
-            actual_birth_locs[line_graph][loc] = {"counts": []}
-        actual_birth_locs[line_graph][loc]["counts"].append(int(line["births"]))
+    if birth_locs_data_path.endswith(".npz"):
+        # Births matrix (runs x locations); -1 indicates no birth count for location.
+        births_matrix = utils.read_births_matrix(birth_locs_data_path)
+        run_graphs = np.array(births_matrix["graph_file"])
+        for line_graph in sorted(set(births_matrix["graph_file"])):
+            graph_births = births_matrix["births"][run_graphs == line_graph]
+            actual_birth_locs[line_graph] = {
+                loc:{"counts": graph_births[graph_births[:, loc] >= 0, loc].tolist()}
+                for loc in range(graph_births.shape[1])
+                if np.any(graph_births[:, loc] >= 0)
+            }
+    else:
+        birth_loc_data = utils.read_csv(birth_locs_data_path)
+        for line in birth_loc_data:
+            line_graph = line["graph_file"]
+            if not line_graph in actual_birth_locs:
+                actual_birth_locs[line_graph] = {}
+            loc = int(line["loc_id"])
+            if not loc in actual_birth_locs[line_graph]:
+                actual_birth_locs[line_graph][loc] = {"counts": []}
+            actual_birth_locs[line_graph][loc]["counts"].append(int(line["births"]))
 
     # Summarize each distribution
     total_births_by_graph = {}
@@ -233,7 +228,8 @@ def main():
     ############################################################################
     # Load each graph, output properties
     ############################################################################
-    graph_expected_births_info = {}
+    # Expected births for every graph: {graph file: (expected births, proportion expected births)}
+    graph_expected_births_info = gutils.calc_expected_births_batch(graphs_dir, graph_files, jobs=args.jobs)
     graph_summary_info = []
     for graph_file in graph_files:
         print(f"Graph file: {graph_file}")
@@ -247,29 +243,21 @@ def main():
         # else:
         graph = gutils.read_graph_matrix(graph_path)
 
-        graph_expected_births_info[graph_file] = gutils.calc_expected_births(graph)
-
-        graph_summary_info.append(calc_graph_summary_properties(graph))
+        graph_summary_info.append(calc_graph_summary_properties(graph, jobs=args.jobs, property_store=args.property_store))
 
 
-        node_properties = {
-            # "percolation_centrality": nx.percolation_centrality(graph),
-            # "harmonic_centrality": nx.harmonic_centrality(graph),
-            # "subgraph_centrality": nx.subgraph_centrality(graph),
-            # "eigenvector_centrality": nx.eigenvector_centrality(graph),
-            # "load_centrality": nx.load_centrality(graph),
-            # "second_order_centrality": nx.second_order_centrality(graph),
-            # "triangles": nx.triangles(graph),
-            # "closeness_centrality": nx.closeness_centrality(graph),
-            # "information_centrality": nx.information_centrality(graph),
-            # "clustering": nx.clustering(graph)
-        }
+        # Closeness, harmonic, eigenvector, information, subgraph, load, and second order
+        # centrality + triangles and clustering (see graph_centrality.centrality_names)
+        # "percolation_centrality": nx.percolation_centrality(graph),
+        print("  analyzing node centralities")
+        node_properties = gcent.calc_node_centralities(graph, jobs=args.jobs)
 
         # Add attributes to graph nodes
         for loc in graph.nodes():
-            expected_births = graph_expected_births_info[graph_file][loc]["prop_births"]
+            expected_births = graph_expected_births_info[graph_file][1][loc].item()
             actual_births_prop = actual_birth_locs[graph_file][loc]["prop"]
-            all_task_prop = task_location_info[graph_file][loc]["all"]["prop"] if loc in task_location_info[graph_file] else 0
+            # Locations without any task appearances are given 0
+            all_task_prop = task_location_info[graph_file]["all_prop"][loc].item() if task_location_info[graph_file]["all_count"][loc] > 0 else 0
             all_vs_expected = all_task_prop - expected_births
             all_vs_actual = all_task_prop - actual_births_prop
             graph.nodes[loc]["expected_births_prop"] = expected_births
@@ -1,6 +1,19 @@
+import collections
+import concurrent.futures
 import csv
 import errno
+import io
+import json
+import numpy as np
 import os
+import resource
+import sys
+import tarfile
+import time
+import zipfile
+
+# Archive file extensions that can be read from as if they were directories.
+archive_extensions = (".tar", ".tar.gz", ".tgz", ".zip")
 
 def mkdir_p(path):
     """
@@ -13,13 +26,352 @@ def mkdir_p(path):
             pass
         else: raise
 
+def peak_rss_mb(children=False):
+    '''
+    Returns peak resident set size (in MB) of the current process.
+    If children, returns the largest peak of any terminated (and waited for) child process.
+    '''
+    if not children:
+        try:
+            # Linux: VmHWM can be reset with reset_peak_rss
+            with open("/proc/self/status", "r") as fp:
+                for line in fp:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    max_rss = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+def reset_peak_rss():
+    '''
+    Reset peak resident set size of the current process (Linux only; otherwise
+    peak_rss_mb will continue to report the peak over the lifetime of the process).
+    '''
+    try:
+        with open("/proc/self/clear_refs", "w") as fp:
+            fp.write("5")
+    except OSError:
+        pass
+
+########################################
+# Reading from archives
+# - Paths that pass through an archive file (e.g., data/C0.tar.gz/RUN_C0_1000/data/time.dat)
+#   are read directly out of the archive without extracting it.
+########################################
+# Archives opened by this process (or inherited from the parent of a forked worker process).
+# Indexed by archive path: (pid, archive, members, member infos).
+_open_archives = {}
+
+def is_archive(path):
+    return path.endswith(archive_extensions) and os.path.isfile(path)
+
+def split_archive_path(path):
+    '''
+    Split a path that passes through an archive into (archive path, member path).
+    Returns (None, path) if path does not pass through an archive.
+    '''
+    parts = os.path.normpath(path).split(os.sep)
+    for i in range(1, len(parts) + 1):
+        archive_path = os.sep.join(parts[:i])
+        if archive_path.endswith(archive_extensions) and os.path.isfile(archive_path):
+            return (archive_path, "/".join(parts[i:]))
+    return (None, path)
+
+def _open_archive(archive_path):
+    if archive_path.endswith(".zip"):
+        return zipfile.ZipFile(archive_path, "r")
+    return tarfile.open(archive_path, "r")
+
+def get_archive(archive_path):
+    '''
+    Open archive (cached per-process). Returns (archive, members), where members maps
+    each member file path to its (size, mtime_ns) and each directory path to None.
+    The member index is only built once: forked worker processes re-open the archive (file
+    offsets are shared with the parent) but reuse the index built by their parent, so a
+    compressed tar archive is not decompressed end to end again just to list it.
+    '''
+    cached = _open_archives.get(archive_path)
+    if cached is not None and cached[0] == os.getpid():
+        return cached[1:3]
+    if cached is not None:
+        _, _, members, member_infos = cached
+        archive = _open_archive(archive_path)
+        _open_archives[archive_path] = (os.getpid(), archive, members, member_infos)
+        return (archive, members)
+    members = {}
+    member_infos = {}   # Member file path => ZipInfo / TarInfo
+    archive = _open_archive(archive_path)
+    if archive_path.endswith(".zip"):
+        for info in archive.infolist():
+            if not info.is_dir():
+                mtime = int(time.mktime(info.date_time + (0, 0, -1)))
+                members[info.filename.strip("/")] = (info.file_size, mtime * 10**9)
+                member_infos[info.filename.strip("/")] = info
+    else:
+        for info in archive.getmembers():
+            if info.isfile():
+                members[os.path.normpath(info.name)] = (info.size, int(info.mtime) * 10**9)
+                member_infos[os.path.normpath(info.name)] = info
+    # Add (implicit) directories
+    for name in list(members.keys()):
+        parent = os.path.dirname(name)
+        while parent != "" and parent not in members:
+            members[parent] = None
+            parent = os.path.dirname(parent)
+    _open_archives[archive_path] = (os.getpid(), archive, members, member_infos)
+    return (archive, members)
+
+def load_archive_indexes(paths):
+    '''
+    Build the member index of every archive that paths pass through (e.g., before starting
+    worker processes, which then share the index instead of each re-listing the archive).
+    '''
+    for path in paths:
+        archive_path, _ = split_archive_path(path)
+        if archive_path is not None:
+            get_archive(archive_path)
+
+def path_is_seekable(path):
+    '''
+    Whether seeking within a file is cheap: regular files and uncompressed archive members.
+    Seeking backwards in a compressed member re-decompresses it from the start (for .tar.gz,
+    from the start of the archive).
+    '''
+    archive_path, member = split_archive_path(path)
+    if archive_path is None:
+        return True
+    if archive_path.endswith(".zip"):
+        return _open_archives[archive_path][3][member].compress_type == zipfile.ZIP_STORED
+    return archive_path.endswith(".tar")
+
+def open_file(path, mode="r"):
+    '''
+    Open a file for reading ("r" or "rb"), which may be inside an archive.
+    '''
+    archive_path, member = split_archive_path(path)
+    if archive_path is None:
+        return open(path, mode)
+    archive, members = get_archive(archive_path)
+    if members.get(member) is None:
+        raise FileNotFoundError(f"No such file in archive: {path}")
+    # Open by member info (tar archives re-opened in worker processes have not been listed)
+    member_info = _open_archives[archive_path][3][member]
+    if archive_path.endswith(".zip"):
+        fp = archive.open(member_info, "r")
+    else:
+        fp = archive.extractfile(member_info)
+    return fp if "b" in mode else io.TextIOWrapper(fp)
+
+def path_isfile(path):
+    archive_path, member = split_archive_path(path)
+    if archive_path is None:
+        return os.path.isfile(path)
+    if member == "":
+        return True
+    return get_archive(archive_path)[1].get(member) is not None
+
+def path_isdir(path):
+    archive_path, member = split_archive_path(path)
+    if archive_path is None:
+        return os.path.isdir(path)
+    if member == "":
+        return False
+    members = get_archive(archive_path)[1]
+    return (member in members) and (members[member] is None)
+
+def path_getsize(path):
+    archive_path, member = split_archive_path(path)
+    if archive_path is None or member == "":
+        return os.path.getsize(path)
+    return get_archive(archive_path)[1][member][0]
+
+def scan_dir(path):
+    '''
+    List the contents of a directory (which may be an archive or inside an archive).
+    Returns list of (name, is_file, size, mtime_ns); size and mtime_ns are None for directories.
+    Archives are listed as directories.
+    '''
+    archive_path, member = split_archive_path(path)
+    if archive_path is None:
+        entries = []
+        with os.scandir(path) as dir_entries:
+            for entry in dir_entries:
+                if entry.is_file() and not entry.name.endswith(archive_extensions):
+                    entry_stat = entry.stat()
+                    entries.append((entry.name, True, entry_stat.st_size, entry_stat.st_mtime_ns))
+                else:
+                    entries.append((entry.name, False, None, None))
+        return entries
+    members = get_archive(archive_path)[1]
+    prefix = "" if member == "" else member + "/"
+    entries = []
+    for name in members:
+        if name.startswith(prefix) and "/" not in name[len(prefix):]:
+            info = members[name]
+            entries.append((
+                name[len(prefix):],
+                info is not None,
+                None if info is None else info[0],
+                None if info is None else info[1]
+            ))
+    return entries
+
+def search_dir_for_runs(data_dir, rel_path, run_identifier):
+    '''
+    Scan a single directory (or archive) for run directories.
+    Archives found in the directory are scanned as part of the directory.
+    Returns (modification time of each directory / archive scanned, run directories, directories to search).
+    All returned paths are relative to data_dir.
+    '''
+    path = os.path.join(data_dir, rel_path)
+    archive_path, member = split_archive_path(path)
+    searched = {}
+    # Archive contents can only change if the archive itself changes.
+    if archive_path is None or member == "":
+        searched[rel_path] = os.stat(path).st_mtime_ns
+    run_dirs = []
+    search_dirs = []
+    for name, is_file, _, _ in scan_dir(path):
+        if is_file:
+            continue
+        child_rel_path = os.path.join(rel_path, name)
+        if run_identifier not in run_dir_name(name):
+            if is_archive(os.path.join(data_dir, child_rel_path)):
+                archive_searched, archive_run_dirs, archive_search_dirs = search_dir_for_runs(
+                    data_dir,
+                    child_rel_path,
+                    run_identifier
+                )
+                searched.update(archive_searched)
+                run_dirs.extend(archive_run_dirs)
+                search_dirs.extend(archive_search_dirs)
+            else:
+                search_dirs.append(child_rel_path)
+        elif is_archive(os.path.join(data_dir, child_rel_path)):
+            # Archive holds run directories (or is a single run's contents)
+            archived_dirs = [
+                os.path.join(child_rel_path, entry[0])
+                for entry in scan_dir(os.path.join(data_dir, child_rel_path))
+                if (not entry[1]) and (run_identifier in entry[0])
+            ]
+            run_dirs.extend(archived_dirs if len(archived_dirs) > 0 else [child_rel_path])
+        else:
+            run_dirs.append(child_rel_path)
+    return (searched, run_dirs, search_dirs)
+
+def find_run_dirs(
+    data_dir,
+    run_identifier,
+    require_file=None,
+    max_depth=2,
+    threads=8,
+    cache_path=None
+):
+    '''
+    Find run directories (directories whose name contains run_identifier) in data_dir.
+    - Searches nested directories (e.g., job-set-N/) up to max_depth levels below data_dir
+      (archives do not count as a level).
+    - Run directories may be loose directories or archived (either one archive per run or
+      many runs per archive).
+    - Directories are scanned concurrently (using threads) to hide filesystem latency.
+    - If require_file is given (relative to the run directory), runs without it are skipped.
+    - If cache_path is given, discovered runs are cached along with the modification time of
+      every directory searched. Repeat discovery only re-searches if one of those directories
+      has changed (skipped runs are always re-checked).
+    Returns (run directories, skipped run directories), as paths relative to data_dir, sorted
+    by run directory name.
+    '''
+    cache_settings = {
+        "data_dir": os.path.abspath(data_dir),
+        "run_identifier": run_identifier,
+        "require_file": require_file,
+        "max_depth": max_depth
+    }
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        cache = None
+        if cache_path is not None and os.path.isfile(cache_path):
+            with open(cache_path, "r") as fp:
+                cache = json.load(fp)
+            if cache["settings"] != cache_settings:
+                cache = None
+        if cache is not None:
+            # Cache is valid if no searched directory has changed.
+            search_paths = list(cache["searched"].keys())
+            mtimes = executor.map(
+                lambda rel_path: os.stat(os.path.join(data_dir, rel_path)).st_mtime_ns if os.path.exists(os.path.join(data_dir, rel_path)) else None,
+                search_paths
+            )
+            if any(mtime != cache["searched"][rel_path] for rel_path, mtime in zip(search_paths, mtimes)):
+                cache = None
+        if cache is not None:
+            searched = cache["searched"]
+            run_dirs = cache["run_dirs"]
+            candidate_run_dirs = cache["skipped"]
+        else:
+            # Breadth-first search, scanning all directories at the same depth concurrently.
+            searched = {}
+            run_dirs = []
+            candidate_run_dirs = []
+            search_dirs = [""]
+            for depth in range(max_depth + 1):
+                next_search_dirs = []
+                results = executor.map(
+                    lambda rel_path: search_dir_for_runs(data_dir, rel_path, run_identifier),
+                    search_dirs
+                )
+                for dir_searched, found_run_dirs, found_search_dirs in results:
+                    searched.update(dir_searched)
+                    candidate_run_dirs.extend(found_run_dirs)
+                    next_search_dirs.extend(found_search_dirs)
+                search_dirs = next_search_dirs
+        # Check for required file
+        skipped_run_dirs = []
+        if require_file is not None:
+            has_required = list(executor.map(
+                lambda rel_path: path_isfile(os.path.join(data_dir, rel_path, require_file)),
+                candidate_run_dirs
+            ))
+            skipped_run_dirs = [rel_path for rel_path, found in zip(candidate_run_dirs, has_required) if not found]
+            candidate_run_dirs = [rel_path for rel_path, found in zip(candidate_run_dirs, has_required) if found]
+        run_dirs = sorted(run_dirs + candidate_run_dirs, key = run_dir_name)
+        skipped_run_dirs = sorted(skipped_run_dirs, key = run_dir_name)
+
+    if cache_path is not None:
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump(
+                {
+                    "settings": cache_settings,
+                    "searched": searched,
+                    "run_dirs": run_dirs,
+                    "skipped": skipped_run_dirs
+                },
+                fp
+            )
+        os.replace(tmp_path, cache_path)
+
+    return (run_dirs, skipped_run_dirs)
+
+def run_dir_name(run_dir):
+    '''
+    Name of run directory (without any parent directories or archive extension).
+    '''
+    name = os.path.basename(os.path.normpath(run_dir))
+    for ext in archive_extensions:
+        if name.endswith(ext):
+            return name[:-len(ext)]
+    return name
+
 def read_csv(file_path):
     """
     Read content of csv file into a list where each entry in the list is a dictionary
     with header:value entries.
     """
     content = None
-    with open(file_path, "r") as fp:
+    with open_file(file_path, "r") as fp:
         content = fp.read().strip().split("\n")
     header = content[0].split(",")
     content = content[1:]
@@ -57,9 +409,275 @@ def write_task_grid_data(
     ]
     write_csv(output_path, content)
 
+########################################
+# Packed task grids
+# - All runs' task grids are stored in a single binary file (task_profiles.bin), with one
+#   record of shape (num_cells, ceil(num_tasks / 8)) (task profile bits packed into bytes)
+#   per run per update. An index file (task_profiles_index.csv) gives each record's seed,
+#   update, and location in the binary file.
+########################################
+packed_task_grids_fname = "task_profiles.bin"
+packed_task_grids_index_fname = "task_profiles_index.csv"
+packed_task_grids_index_fields = ["record", "seed", "update", "csv_name", "num_cells", "num_tasks", "offset"]
+
+def pack_task_grid(task_grid_data:dict):
+    '''
+    Pack task profiles from task_grid_data (in format given by read_avida_task_grid)
+    into a (num_cells, ceil(num_tasks / 8)) uint8 array, ordered by location id.
+    '''
+    profiles = [task_grid_data[id]["task_profile"] for id in sorted(task_grid_data)]
+    bits = np.frombuffer("".join(profiles).encode(), dtype=np.uint8) == ord("1")
+    return np.packbits(bits.reshape(len(profiles), -1), axis=1)
+
+def unpack_task_grid(packed, num_tasks:int):
+    '''
+    Unpack (num_cells, ceil(num_tasks / 8)) array given by pack_task_grid.
+    Returns list of task profile strings (indexed by location id).
+    '''
+    bits = np.unpackbits(np.asarray(packed), axis=1, count=num_tasks)
+    chars = np.where(bits == 1, ord("1"), ord("0")).astype(np.uint8)
+    return [row.tobytes().decode() for row in chars]
+
+def read_packed_task_grids_index(task_grids_dir):
+    rows = read_csv(os.path.join(task_grids_dir, packed_task_grids_index_fname))
+    for row in rows:
+        for field in ["record", "num_cells", "num_tasks", "offset"]:
+            row[field] = int(row[field])
+    return rows
+
+def write_packed_task_grids_index(task_grids_dir, rows):
+    tmp_path = os.path.join(task_grids_dir, packed_task_grids_index_fname + ".tmp")
+    with open(tmp_path, "w") as fp:
+        fp.write(",".join(packed_task_grids_index_fields))
+        for row in rows:
+            fp.write("\n")
+            fp.write(",".join([str(row[field]) for field in packed_task_grids_index_fields]))
+    os.replace(tmp_path, os.path.join(task_grids_dir, packed_task_grids_index_fname))
+
+def read_packed_task_grid(task_grids_dir, index_row, packed_grids=None):
+    '''
+    Read a single packed task grid record (described by index_row).
+    packed_grids can be given as a (memory-mapped) uint8 array of the whole binary file.
+    '''
+    if packed_grids is None:
+        packed_grids = np.memmap(
+            os.path.join(task_grids_dir, packed_task_grids_fname),
+            dtype=np.uint8,
+            mode="r"
+        )
+    row_bytes = (index_row["num_tasks"] + 7) // 8
+    record_size = index_row["num_cells"] * row_bytes
+    offset = index_row["offset"]
+    return packed_grids[offset:offset + record_size].reshape(index_row["num_cells"], row_bytes)
+
+def load_packed_task_grids(task_grids_dir):
+    '''
+    Load all packed task grids as a single (runs, cells, ceil(num_tasks / 8)) array
+    (memory-mapped; requires all records to have the same shape).
+    Returns (index rows, array).
+    '''
+    index = read_packed_task_grids_index(task_grids_dir)
+    if len({(row["num_cells"], row["num_tasks"]) for row in index}) > 1:
+        print("Packed task grids have different shapes, cannot load as a single array.")
+        exit(-1)
+    if len(index) == 0:
+        return (index, np.zeros((0, 0, 0), dtype=np.uint8))
+    num_cells = index[0]["num_cells"]
+    row_bytes = (index[0]["num_tasks"] + 7) // 8
+    packed_grids = np.memmap(
+        os.path.join(task_grids_dir, packed_task_grids_fname),
+        dtype=np.uint8,
+        mode="r"
+    )
+    record_size = num_cells * row_bytes
+    if all(index[i]["offset"] == i * record_size for i in range(len(index))):
+        # Records are contiguous, no need to copy
+        records = packed_grids[:len(index) * record_size]
+    else:
+        records = np.stack([read_packed_task_grid(task_grids_dir, row, packed_grids) for row in index])
+    return (index, records.reshape(len(index), num_cells, row_bytes))
+
+########################################
+# Birth counts by location
+# - A births matrix holds birth counts for many runs as a (runs x locations) array,
+#   along with each run's seed / graph (stored as .npz; see write_births_matrix).
+########################################
+def read_loc_birth_counts(path):
+    '''
+    Read a loc_birth_counts.csv file (loc_id, births).
+    Returns (loc ids, births) as int64 numpy arrays.
+    '''
+    with open_file(path, "r") as fp:
+        header = fp.readline().strip().split(",")
+        data = np.loadtxt(fp, delimiter=",", dtype=np.int64, ndmin=2)
+    if data.shape[0] == 0:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    return (data[:, header.index("loc_id")], data[:, header.index("births")])
+
+def write_births_matrix(output_path, run_info, run_births):
+    '''
+    Write births matrix (.npz).
+    - run_info: list of per-run dictionaries (seed, graph_file, graph_type)
+    - run_births: list of per-run (loc ids, births) arrays (as given by read_loc_birth_counts)
+    Locations without a birth count for a run are given -1.
+    '''
+    num_locs = max([int(loc_ids.max()) + 1 for loc_ids, _ in run_births if len(loc_ids) > 0], default=0)
+    births = np.full((len(run_births), num_locs), -1, dtype=np.int64)
+    for run_i, (loc_ids, run_loc_births) in enumerate(run_births):
+        births[run_i, loc_ids] = run_loc_births
+    np.savez(
+        output_path,
+        births = births,
+        seed = np.array([info["seed"] for info in run_info], dtype=str),
+        graph_file = np.array([info["graph_file"] for info in run_info], dtype=str),
+        graph_type = np.array([info["graph_type"] for info in run_info], dtype=str)
+    )
+
+def read_births_matrix(path):
+    '''
+    Read births matrix written by write_births_matrix.
+    Returns dictionary with births (runs x locations array) and per-run seed, graph_file, and
+    graph_type (lists of strings).
+    '''
+    with np.load(path) as data:
+        return {
+            "births": data["births"],
+            "seed": data["seed"].tolist(),
+            "graph_file": data["graph_file"].tolist(),
+            "graph_type": data["graph_type"].tolist()
+        }
+
+def births_matrix_rows(births_matrix):
+    '''
+    Returns rows (in the same format as read_csv of graph_birth_info.csv) from a births matrix.
+    '''
+    births = births_matrix["births"]
+    rows = []
+    for run_i in range(births.shape[0]):
+        for loc_id in np.flatnonzero(births[run_i] >= 0):
+            rows.append({
+                "births": str(births[run_i, loc_id]),
+                "graph_file": births_matrix["graph_file"][run_i],
+                "graph_type": births_matrix["graph_type"][run_i],
+                "loc_id": str(loc_id),
+                "seed": births_matrix["seed"][run_i]
+            })
+    return rows
+
+def read_graph_birth_data(path):
+    '''
+    Read graph birth location data, either as csv (graph_birth_info.csv) or as a births
+    matrix (graph_birth_info.npz). Returns rows in the same format as read_csv.
+    '''
+    if path.endswith(".npz"):
+        return births_matrix_rows(read_births_matrix(path))
+    return read_csv(path)
+
+def write_birth_counts_by_update_info(output_path, updates, run_info):
+    '''
+    Write metadata for a (runs x updates x locations) birth counts array.
+    - updates: update for each index along the array's second axis.
+    - run_info: list of per-run dictionaries (seed, graph_file, graph_type, run_dir).
+    '''
+    with open(output_path, "w") as fp:
+        json.dump({"updates": updates, "runs": run_info}, fp, indent=2)
+
+def load_birth_counts_by_update(data_dir):
+    '''
+    Load (memory-mapped, read-only) birth counts array written by ingest-birth-count-dumps.py.
+    Returns (array indexed by [run, update index, loc_id], metadata), where metadata gives
+    the updates along the array's second axis and per-run seed / graph information.
+    '''
+    birth_counts = np.load(os.path.join(data_dir, "birth_counts_by_update.npy"), mmap_mode="r")
+    with open(os.path.join(data_dir, "birth_counts_by_update.json"), "r") as fp:
+        info = json.load(fp)
+    return (birth_counts, info)
+
+########################################
+# Summary data
+########################################
+def filter_summary_target_update(summary_data, target_update=None):
+    '''
+    Keep one summary line per run (seed) from summary data generated by aggregate.py with
+    multiple summary updates (one line per run per target_update): lines for target_update,
+    or each run's final target update if target_update is None.
+    Summary data without a target_update field (one line per run) is returned as is.
+    '''
+    if len(summary_data) == 0 or "target_update" not in summary_data[0]:
+        return summary_data
+    if target_update is not None:
+        return [line for line in summary_data if int(line["target_update"]) == target_update]
+    final_target_updates = {}
+    for line in summary_data:
+        seed = line["seed"]
+        final_target_updates[seed] = max(final_target_updates.get(seed, -1), int(line["target_update"]))
+    return [
+        line for line in summary_data
+        if int(line["target_update"]) == final_target_updates[line["seed"]]
+    ]
+
+########################################
+# First task appearance locations
+########################################
+def read_first_task_locs(summary_data, task_names):
+    '''
+    Collect first task appearance locations (task_loc_<task>_loc_id fields in summary data
+    generated by aggregate.py) into a (runs x tasks) int array of location ids.
+    Tasks that were not completed are given -1.
+    '''
+    locs = np.full((len(summary_data), len(task_names)), -1, dtype=np.int64)
+    for run_i, line in enumerate(summary_data):
+        for task_i, task in enumerate(task_names):
+            if line[f"task_loc_{task}_completed"] == "1":
+                locs[run_i, task_i] = int(line[f"task_loc_{task}_loc_id"])
+    return locs
+
+def count_locs(locs, num_locs):
+    '''
+    Count occurrences of each location id in each row of locs (2D int array; -1 is ignored).
+    Returns (rows x num_locs) array of counts.
+    '''
+    num_rows = locs.shape[0]
+    row_ids = np.broadcast_to(np.arange(num_rows)[:, None], locs.shape)
+    valid = locs >= 0
+    counts = np.bincount(
+        row_ids[valid] * num_locs + locs[valid],
+        minlength = num_rows * num_locs
+    )
+    return counts.reshape(num_rows, num_locs)
+
+def avida_legend_field(line):
+    '''
+    Convert a single (stripped) avida legend line into a field name.
+    '''
+    # patch 3-input logic tasks because avida file format is nonsense
+    if "Logic 3" in line:
+        line = line.split("(")[0]
+    return line.split(":")[-1].strip().lower().replace(" ", "_")
+
+def avida_dat_row(fields, line, backfill_missing_fields=False):
+    '''
+    Convert a single (stripped) avida data line into a dictionary of field:value.
+    '''
+    data_line = line.split(" ")
+    if len(data_line) > len(fields):
+        print("found more items than there are fields!")
+        print(fields)
+        print(data_line)
+        exit(-1)
+    elif backfill_missing_fields:
+        num_backfill = len(fields) - len(data_line)
+        for _ in range(num_backfill): data_line.append("")
+    elif len(data_line) != len(fields):
+        print("data fields mismatch!")
+        print(fields)
+        print(data_line)
+        exit(-1)
+    return {field:value for field,value in zip(fields, data_line)}
+
 def read_avida_dat_file(path, backfill_missing_fields=False):
     content = None
-    with open(path, "r") as fp:
+    with open_file(path, "r") as fp:
         content = fp.read().strip().split("\n")
     legend_start = 0
     legend_end = 0
@@ -79,39 +697,140 @@ def read_avida_dat_file(path, backfill_missing_fields=False):
         if line == "":
             legend_end = line_i
             break
-        # patch 3-input logic tasks because avida file format is nonsense
-        if "Logic 3" in line:
-            line = line.split("(")[0]
-
-        fields.append( line.split(":")[-1].strip().lower().replace(" ", "_") )
+        fields.append(avida_legend_field(line))
     data = []
     for line_i in range(legend_end, len(content)):
         line = content[line_i].strip()
         if line == "": continue
-        data_line = line.split(" ")
-        if len(data_line) > len(fields):
-            print("found more items than there are fields!")
-            print(fields)
-            print(data_line)
-            exit(-1)
-        elif backfill_missing_fields:
-            num_backfill = len(fields) - len(data_line)
-            for _ in range(num_backfill): data_line.append("")
-        elif len(data_line) != len(fields):
-            print("data fields mismatch!")
-            print(fields)
-            print(data_line)
-            exit(-1)
-        data.append({field:value for field,value in zip(fields, data_line)})
+        data.append(avida_dat_row(fields, line, backfill_missing_fields))
     return data
 
+def read_tail_lines(fp, num_lines, min_offset=0, block_size=65536, seekable=True):
+    '''
+    Read the last num_lines non-empty lines from a file opened in binary mode,
+    seeking backwards from the end of the file in blocks of block_size bytes.
+    Never reads before min_offset (e.g., the end of a file's header).
+    If fp is not (cheaply) seekable (e.g., a compressed archive member), reads forward
+    from the current position (must be min_offset) instead.
+    '''
+    if not seekable:
+        lines = collections.deque(maxlen=max(num_lines, 0))
+        for raw_line in fp:
+            line = raw_line.strip()
+            if line != b"":
+                lines.append(line)
+        return [line.decode() for line in lines]
+    fp.seek(0, os.SEEK_END)
+    pos = fp.tell()
+    buffer = b""
+    lines = []
+    while pos > min_offset:
+        read_size = min(block_size, pos - min_offset)
+        pos -= read_size
+        fp.seek(pos)
+        buffer = fp.read(read_size) + buffer
+        lines = buffer.split(b"\n")
+        # Unless we've hit min_offset, the first line may be partial.
+        if pos > min_offset:
+            lines = lines[1:]
+        lines = [line.strip() for line in lines if line.strip() != b""]
+        if len(lines) >= num_lines:
+            break
+    return [line.decode() for line in lines[-num_lines:]] if num_lines > 0 else []
+
+def read_avida_dat_legend(fp):
+    '''
+    Read the legend from the head of an avida .dat file opened in binary mode.
+    Leaves fp positioned at the first line after the legend.
+    Returns list of fields.
+    '''
+    fields = []
+    in_legend = False
+    for raw_line in iter(fp.readline, b""):
+        line = raw_line.decode().strip()
+        if not in_legend:
+            if line == "# Legend:":     # Handles analyze mode detail files.
+                in_legend = True
+                continue
+            if "#  1:" in line:         # Handles time.dat file.
+                in_legend = True
+        if in_legend:
+            if line == "":
+                break
+            fields.append(avida_legend_field(line))
+    return fields
+
+def read_avida_dat_file_tail(path, num_rows=1, backfill_missing_fields=False):
+    '''
+    Read only the final num_rows rows of an avida .dat file.
+    Parses the legend from the head of the file and then seeks from the end
+    of the file, so cost does not depend on how many rows the file holds.
+    Returns rows in the same format as read_avida_dat_file.
+    '''
+    with open_file(path, "rb") as fp:
+        fields = read_avida_dat_legend(fp)
+        lines = read_tail_lines(fp, num_rows, min_offset=fp.tell(), seekable=path_is_seekable(path))
+    return [avida_dat_row(fields, line, backfill_missing_fields) for line in lines]
+
+def iter_avida_dat_file(path, fields=None, backfill_missing_fields=False):
+    '''
+    Iterate over rows of an avida .dat file one at a time.
+    If fields is given, each row only holds those fields.
+    '''
+    with open_file(path, "rb") as fp:
+        file_fields = read_avida_dat_legend(fp)
+        for raw_line in fp:
+            line = raw_line.decode().strip()
+            if line == "": continue
+            row = avida_dat_row(file_fields, line, backfill_missing_fields)
+            yield row if fields is None else {field:row[field] for field in fields if field in row}
+
+def iter_csv(file_path, fields=None):
+    '''
+    Iterate over rows of a csv file one at a time (in the same format as read_csv).
+    If fields is given, each row only holds those fields.
+    '''
+    with open_file(file_path, "r") as fp:
+        header = fp.readline().strip().split(",")
+        keep = [
+            i for i in range(len(header))
+            if (fields is None) or (header[i] in fields)
+        ]
+        for l in csv.reader(
+            (line for line in fp if line.strip() != ""),
+            quotechar='"',
+            delimiter=',',
+            quoting=csv.QUOTE_ALL,
+            skipinitialspace=True
+        ):
+            yield {header[i]: l[i] for i in keep}
+
+def read_csv_tail(file_path, num_rows=1):
+    '''
+    Read only the header and final num_rows rows of a csv file.
+    Returns rows in the same format as read_csv.
+    '''
+    with open_file(file_path, "rb") as fp:
+        header = fp.readline().decode().strip().split(",")
+        lines = read_tail_lines(fp, num_rows, min_offset=fp.tell(), seekable=path_is_seekable(file_path))
+    return [
+        {header[i]: l[i] for i in range(len(header))}
+        for l in csv.reader(
+            lines,
+            quotechar='"',
+            delimiter=',',
+            quoting=csv.QUOTE_ALL,
+            skipinitialspace=True
+        )
+    ]
+
 def read_avida_task_grid(filename, num_tasks=77):
     '''
     Reads avida task grid file.
     Returns two-dimentional
     '''
     lines = []
-    with open(filename, "r") as fp:
+    with open_file(filename, "r") as fp:
         content = fp.read().strip()
         lines = [list(map(int, line.strip().split(" "))) for line in content.split("\n")]
     grid_info = {}
@@ -1,10 +1,16 @@
+import argparse
 import utilities as utils
 import graph_generators as ggen
+import graph_utilities as gutils
 import networkx as nx
 import statistics as stats
 
-def summarize_graph(graph, name):
+def summarize_graph(graph, name, property_store=None):
     properties = {"graph_name": name}
+    # Expensive properties are cached in property store (if given), keyed by graph content
+    graph_hash = gutils.graph_content_hash(graph) if property_store is not None else None
+    def cached(prop_name, compute_fun):
+        return gutils.cached_graph_property(property_store, graph_hash, prop_name, compute_fun)
     # Check connectivity
     is_connected = nx.is_connected(graph)
     # Density
@@ -15,11 +21,11 @@ def summarize_graph(graph, name):
     properties["degree_median"] = stats.median(node_degrees)
     properties["degree_variance"] = stats.variance(node_degrees)
     print("  degree done")
-    properties["girth"] = nx.girth(graph)
+    properties["girth"] = cached("girth", lambda: nx.girth(graph))
     print("  girth done")
-    properties["degree_assortivity_coef"] = nx.degree_assortativity_coefficient(graph)
+    properties["degree_assortivity_coef"] = cached("degree_assortivity_coef", lambda: nx.degree_assortativity_coefficient(graph))
     print("  degree assortivity coef done")
-    properties["num_articulation_points"] = len(list(nx.articulation_points(graph)))
+    properties["num_articulation_points"] = cached("num_articulation_points", lambda: len(list(nx.articulation_points(graph))))
     print("  articulation points done")
     # properties["num_bridges"] = len(list(nx.bridges(graph)))
     # properties["max_clique_size"] = len(nx.make_max_clique_graph(graph).nodes)
@@ -32,10 +38,11 @@ def summarize_graph(graph, name):
     # properties["edge_connectivity"] = nx.edge_connectivity(graph)
     # properties["node_connectivity"] = nx.node_connectivity(graph)
     # print("  connectivity done")
-    properties["diameter"] = nx.diameter(graph) if is_connected else "error"
+    distance_properties = cached("distance_properties", lambda: gutils.calc_distance_properties(graph))
+    properties["diameter"] = distance_properties["diameter"] if is_connected else "error"
     print("  diameter done")
     # properties["radius"] = nx.radius(graph) if is_connected else "error"
-    properties["kemeny_constant"] = nx.kemeny_constant(graph) if is_connected else "error"
+    properties["kemeny_constant"] = cached("kemeny_constant", lambda: gutils.calc_kemeny_constant(graph)) if is_connected else "error"
     print("  kemeny constant done")
     # properties["global_efficiency"] = nx.global_efficiency(graph)
     # properties["wiener_index"] = nx.wiener_index(graph)
@@ -47,6 +54,11 @@ def summarize_graph(graph, name):
 def main():
     '''
     '''
+    parser = argparse.ArgumentParser(description="Summarize properties of generated graphs.")
+    parser.add_argument("--property_store", type=str, default=None, help="Directory used to cache graph properties (keyed by graph content) across runs")
+    args = parser.parse_args()
+    property_store = args.property_store
+
     num_graphs = 1
     graph_size = 3600
     graphs = []
@@ -59,7 +71,7 @@ def main():
     for i in range(num_graphs):
         print("  rw", i)
         graph = ggen.gen_graph_random_waxman(graph_size, 0.4, 0.2, i)
-        graph_content.append(summarize_graph(graph, f"random_waxman_{i}"))
+        graph_content.append(summarize_graph(graph, f"random_waxman_{i}", property_store))
 
     # Comet-kite
     for i in range(num_graphs):
@@ -69,7 +81,7 @@ def main():
             additional_tail_nodes = 1440
         )
         ggen.add_random_nodes(graph, graph_size)
-        graph_content.append(summarize_graph(graph, f"comet_kite_{i}"))
+        graph_content.append(summarize_graph(graph, f"comet_kite_{i}", property_store))
 
     # Clique ring
     for i in range(num_graphs):
@@ -79,23 +91,24 @@ def main():
             nodes_between_cliques = 5
         )
         ggen.add_random_nodes(graph, graph_size)
-        graph_content.append(summarize_graph(graph, f"clique_ring_{i}"))
+        graph_content.append(summarize_graph(graph, f"clique_ring_{i}", property_store))
 
     # Wheel
     graph_content.append(
-        summarize_graph(ggen.gen_graph_wheel(nodes = graph_size), "wheel")
+        summarize_graph(ggen.gen_graph_wheel(nodes = graph_size), "wheel", property_store)
     )
 
     #  Star
     graph_content.append(
-        summarize_graph(ggen.gen_graph_star(nodes = graph_size), "star")
+        summarize_graph(ggen.gen_graph_star(nodes = graph_size), "star", property_store)
     )
 
     # Lattice
     graph_content.append(
         summarize_graph(
             ggen.gen_graph_toroidal_lattice(graph_width=60, graph_height=60),
-            "toroidal-lattice"
+            "toroidal-lattice",
+            property_store
         )
     )
 
@@ -103,7 +116,8 @@ def main():
     graph_content.append(
         summarize_graph(
             ggen.gen_graph_linear_chain(graph_size),
-            "linear-chain"
+            "linear-chain",
+            property_store
         )
     )
 
@@ -111,7 +125,8 @@ def main():
     graph_content.append(
         summarize_graph(
             ggen.gen_graph_cycle(graph_size),
-            "cycle"
+            "cycle",
+            property_store
         )
     )
 
@@ -121,7 +136,8 @@ def main():
     graph_content.append(
         summarize_graph(
             graph,
-            "windmill"
+            "windmill",
+            property_store
         )
     )
 
@@ -129,7 +145,8 @@ def main():
     graph_content.append(
         summarize_graph(
             ggen.gen_graph_well_mixed(graph_size),
-            "well-mixed"
+            "well-mixed",
+            property_store
         )
     )
 